@@ -2,6 +2,7 @@ from flask_admin import Admin
 from flask_admin.contrib.sqla import ModelView
 from flask_jwt_extended import jwt_required, get_jwt
 from database.models import Role
+from authorization.tokens import read_user_claims
 
 
 admin = Admin(name="Auth admin panel", template_mode="bootstrap4")
@@ -10,7 +11,7 @@ admin = Admin(name="Auth admin panel", template_mode="bootstrap4")
 class CustomModelView(ModelView):
     @jwt_required("cookies")
     def is_accessible(self):
-        claims = get_jwt()
+        claims = read_user_claims(get_jwt())
         return claims["role"] == Role.ADMINISTRATOR.value
 
 
@@ -1,20 +1,31 @@
+import hmac
+
 from flask import make_response, request, Blueprint, jsonify
 from flask.views import MethodView
 from typing import Dict
-from config import logger
+from config import logger, INTROSPECT_SERVICE_TOKEN
 from errors import HttpError
 from decorators import with_session
 from signals import registration_user_signal
-from extensions import confirm_code_redis
 
-from authorization.services import get_user_by_username, create_user
+from authorization.services import (
+    get_user_by_username, register_user, schedule_password_rehash
+)
+from authorization.introspection import introspect_tokens
+from authorization.confirmation import (
+    ConfirmationError, read_confirmation_code, consume_confirmation_code,
+    release_confirmation_code
+)
+from users.services import get_user_by_id
+from authorization.tokens import user_claims, read_user_claims
 
+from redis.exceptions import RedisError
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
 from database.models import UserBase
 
-from werkzeug.security import check_password_hash
+from hashing import password_hasher
 
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,
@@ -26,7 +37,8 @@ from authorization.schemas import (
     validate_schema,
     UserRegRequest,
     UserLoginRequest,
-    RefreshTokenRequest
+    RefreshTokenRequest,
+    IntrospectRequest
 )
 
 
@@ -47,11 +59,9 @@ class BaseAuthView(MethodView):
         """
         return create_access_token(
             identity=str(user.id),
-            additional_claims={
-                "username": user.username,
-                "role": user.role.value,
-                "is_active": user.is_active
-            }
+            additional_claims=user_claims(
+                user.username, user.role.value, user.is_active
+            )
         )
 
     def _refresh_token(self, user: UserBase) -> str:
@@ -63,11 +73,9 @@ class BaseAuthView(MethodView):
         """
         return create_refresh_token(
             identity=str(user.id),
-            additional_claims={
-                "username": user.username,
-                "role": user.role.value,
-                "is_active": user.is_active
-            }
+            additional_claims=user_claims(
+                user.username, user.role.value, user.is_active
+            )
         )
 
     def handle_error(
@@ -116,14 +124,15 @@ class RegistrationView(BaseAuthView):
 
         if isinstance(validate_data, UserRegRequest):
 
-            if get_user_by_username(session_db, validate_data.username):
-                self.handle_error(HttpError, "User already exists", 409)
-
             try:
-                new_user = create_user(session_db, validate_data.model_dump())
+                new_user = register_user(session_db, validate_data.model_dump())
+                if new_user is None:
+                    self.handle_error(HttpError, "User already exists", 409)
+
                 # Сигнал о регистрации пользователя для отправки email
                 registration_user_signal.send(
                     self.__class__,
+                    user_id=new_user.id,
                     username=new_user.username,
                     email=new_user.email,
                 )
@@ -175,12 +184,14 @@ class LoginView(BaseAuthView):
                         403
                     )
 
-                if not check_password_hash(
+                if not password_hasher.check(
                     user.h_password,
                     validate_data.password
                 ):
                     self.handle_error(HttpError, "Invalid password", 401)
 
+                schedule_password_rehash(user, validate_data.password)
+
                 access_token = self._access_token(user)
                 refresh_token = self._refresh_token(user)
 
@@ -230,14 +241,11 @@ class RefreshView(BaseAuthView):
 
         if isinstance(validate_data, RefreshTokenRequest):
             try:
-                claims = get_jwt()
                 access_token = create_access_token(
                     identity=get_jwt_identity(),
-                    additional_claims={
-                        "username": claims["username"],
-                        "role": claims["role"],
-                        "is_active": claims["is_active"]
-                    }
+                    additional_claims=user_claims(
+                        **read_user_claims(get_jwt())
+                    )
                 )
 
                 response = make_response({
@@ -276,21 +284,38 @@ class ConfirmEmailView(BaseAuthView):
         :return: Dict[str, str] | HttpError
         """
 
-        username = confirm_code_redis.get(code)
-
-        if not username:
+        try:
+            confirmation = read_confirmation_code(code)
+        except ConfirmationError:
             self.handle_error(HttpError, "Invalid code or code expired", 400)
+        except RedisError as e:
+            logger.error(f"Ошибка Redis при проверке кода подтверждения: {e}")
+            self.handle_error(HttpError, "Service unavailable, try again later", 503)
 
         try:
-            user = get_user_by_username(session_db, username)
+            if "user_id" in confirmation:
+                user = get_user_by_id(session_db, confirmation["user_id"])
+            else:
+                user = get_user_by_username(session_db, confirmation["username"])
+
             if not user:
                 self.handle_error(HttpError, "User not found", 404)
 
             if user.is_active:
                 self.handle_error(HttpError, "User already confirmed", 409)
 
-            user.is_active = True
-            session_db.commit()
+            if not consume_confirmation_code(code, confirmation):
+                self.handle_error(HttpError, "Code already used", 409)
+
+            try:
+                user.is_active = True
+                session_db.commit()
+            except SQLAlchemyError:
+                # Подтверждение не сохранено: код возвращается, иначе
+                # пользователь остался бы с неактивным аккаунтом и без кода
+                session_db.rollback()
+                release_confirmation_code(code, confirmation)
+                raise
             session_db.refresh(user)
 
             access_token = self._access_token(user)
@@ -321,12 +346,53 @@ class ConfirmEmailView(BaseAuthView):
 
             return response
 
+        except RedisError as e:
+            logger.error(f"Ошибка Redis при подтверждении email: {e}")
+            self.handle_error(HttpError, "Service unavailable, try again later", 503)
+
         except SQLAlchemyError as e:
             logger.error(
                 f"Ошибка при подтверждении email: {e}"
             )
             self.handle_error(HttpError, "Internal server error", 500)
 
+class IntrospectView(BaseAuthView):
+    """
+    Класс для пакетной проверки токенов внутренними сервисами
+    """
+
+    def post(self) -> Dict[str, list] | HttpError:
+        """
+        Проверка подписи, срока действия и отзыва пачки токенов
+
+        :param tokens: список токенов
+        :return: Dict[results: List[dict]] | HttpError
+        """
+        service_token = request.headers.get("X-Service-Token", "")
+        if not INTROSPECT_SERVICE_TOKEN or not hmac.compare_digest(
+            service_token.encode(), INTROSPECT_SERVICE_TOKEN.encode()
+        ):
+            logger.warning(
+                f"Отклонен запрос проверки токенов без токена сервиса "
+                f"от {request.remote_addr}"
+            )
+            self.handle_error(HttpError, "Invalid service token", 401)
+
+        validate_data = validate_schema(IntrospectRequest, **request.json)
+
+        if isinstance(validate_data, IntrospectRequest):
+            try:
+                results = introspect_tokens(validate_data.tokens)
+                return jsonify({"results": results}), 200
+
+            except Exception as e:
+                logger.error(f"Ошибка при проверке токенов: {e}")
+                self.handle_error(HttpError, "Internal server error", 500)
+        else:
+            logger.error(
+                f"Ошибка валидации данных проверки токенов: {validate_data}"
+            )
+            self.handle_validation_errors(validate_data)
 
 
 auth_blueprint.add_url_rule(
@@ -346,3 +412,7 @@ auth_blueprint.add_url_rule(
     "/confirm_email/<string:code>",
     view_func=ConfirmEmailView.as_view("confirm_email")
 )
+auth_blueprint.add_url_rule(
+    "/introspect/",
+    view_func=IntrospectView.as_view("introspect")
+)
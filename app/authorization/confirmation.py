@@ -0,0 +1,85 @@
+import secrets
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+from config import CONFIRM_EMAIL_SECRET, CONFIRM_EMAIL_TOKEN_TTL
+from extensions import confirm_code_redis
+
+
+class ConfirmationError(Exception):
+    """
+    Недействительный или просроченный код подтверждения
+    """
+
+
+def _serializer() -> URLSafeTimedSerializer:
+    # Создается при вызове, чтобы отсутствие секрета не мешало импорту приложения
+    return URLSafeTimedSerializer(CONFIRM_EMAIL_SECRET, salt="email-confirm")
+
+
+def make_confirmation_token(user_id: int) -> str:
+    """
+    Подписанный код подтверждения email с id пользователя и nonce.
+    Для проверки не нужно ничего хранить
+
+    :param user_id: id пользователя
+    :return: str
+    """
+    return _serializer().dumps({"uid": user_id, "n": secrets.token_urlsafe(8)})
+
+
+def read_confirmation_code(code: str) -> dict:
+    """
+    Разбор кода подтверждения. Коды, выданные до перехода на подписанные
+    токены, ищутся в Redis
+
+    :param code: код из ссылки подтверждения
+    :return: {"user_id": int, "nonce": str} или {"username": str} для старых кодов
+    """
+    try:
+        data = _serializer().loads(code, max_age=CONFIRM_EMAIL_TOKEN_TTL)
+        return {"user_id": data["uid"], "nonce": data["n"]}
+
+    except SignatureExpired:
+        raise ConfirmationError("Code expired")
+
+    except BadSignature:
+        username = confirm_code_redis.get(code)
+        if not username:
+            raise ConfirmationError("Invalid code")
+
+        return {"username": username}
+
+
+def consume_confirmation_code(code: str, data: dict) -> bool:
+    """
+    Однократное использование кода подтверждения
+
+    :param code: код из ссылки подтверждения
+    :param data: результат read_confirmation_code
+    :return: True, если код использован впервые
+    """
+    if "username" in data:
+        # Старый код удаляется, чтобы не копился в Redis
+        return bool(confirm_code_redis.delete(code))
+
+    # Маркер живет не дольше самого токена
+    return bool(confirm_code_redis.set(
+        f"confirm_used:{data['nonce']}", 1,
+        nx=True, ex=CONFIRM_EMAIL_TOKEN_TTL
+    ))
+
+
+def release_confirmation_code(code: str, data: dict) -> None:
+    """
+    Возврат кода подтверждения, если подтверждение не удалось сохранить,
+    чтобы пользователь мог перейти по ссылке еще раз
+
+    :param code: код из ссылки подтверждения
+    :param data: результат read_confirmation_code
+    """
+    if "username" in data:
+        confirm_code_redis.set(code, data["username"], ex=CONFIRM_EMAIL_TOKEN_TTL)
+        return
+
+    confirm_code_redis.delete(f"confirm_used:{data['nonce']}")
@@ -0,0 +1,64 @@
+import hashlib
+import time
+from hmac import compare_digest
+
+from flask_jwt_extended import JWTManager
+from flask_jwt_extended.exceptions import CSRFError, JWTDecodeError
+
+from cache import TTLCache, MISS
+from metrics import Counter
+
+
+decode_cache_hits = Counter(
+    "jwt_decode_cache_hits_total",
+    "Токены, данные которых взяты из кэша без проверки подписи"
+)
+decode_cache_misses = Counter(
+    "jwt_decode_cache_misses_total",
+    "Токены, прошедшие полную проверку подписи"
+)
+
+
+class CachingJWTManager(JWTManager):
+    """
+    JWTManager с кэшем проверенных токенов.
+
+    Данные токена хранятся до его exp по хэшу токена, повторные запросы
+    с тем же токеном не проверяют подпись заново. Проверка отзыва
+    выполняется flask_jwt_extended после декодирования и не кэшируется
+    """
+
+    def __init__(self, app=None, decode_cache_size: int = 0) -> None:
+        self.decode_cache = (
+            TTLCache(decode_cache_size) if decode_cache_size else None
+        )
+        super().__init__(app)
+
+    def _decode_jwt_from_config(
+        self, encoded_token: str, csrf_value=None, allow_expired: bool = False
+    ) -> dict:
+        if self.decode_cache is None or allow_expired:
+            return super()._decode_jwt_from_config(
+                encoded_token, csrf_value, allow_expired
+            )
+
+        key = hashlib.sha256(encoded_token.encode()).digest()
+        claims = self.decode_cache.get(key)
+
+        if claims is MISS:
+            decode_cache_misses.inc()
+            claims = super()._decode_jwt_from_config(encoded_token)
+            ttl = claims["exp"] - time.time()
+            if ttl > 0:
+                self.decode_cache.set(key, claims, ttl)
+        else:
+            decode_cache_hits.inc()
+
+        # CSRF зависит от запроса, поэтому сверяется каждый раз
+        if csrf_value:
+            if "csrf" not in claims:
+                raise JWTDecodeError("Missing claim: csrf")
+            if not compare_digest(claims["csrf"], csrf_value):
+                raise CSRFError("CSRF double submit tokens do not match")
+
+        return dict(claims)
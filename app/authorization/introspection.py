@@ -0,0 +1,57 @@
+import jwt
+from flask import current_app
+
+from authorization.keys import key_manager
+from authorization.revocation import token_blocklist
+
+
+def _decode(token: str, algorithms: list[str]) -> dict:
+    """
+    Проверка подписи и срока действия токена ключом по kid
+    """
+    header = jwt.get_unverified_header(token)
+    return jwt.decode(
+        token,
+        key_manager.verification_key(header.get("kid")),
+        algorithms=algorithms
+    )
+
+
+def introspect_tokens(tokens: list[str]) -> list[dict]:
+    """
+    Проверка пачки токенов: подпись, срок действия и отзыв
+
+    :param tokens: токены, допускается префикс "Bearer "
+    :return: List[dict] в порядке tokens
+    """
+    algorithms = (
+        current_app.config.get("JWT_DECODE_ALGORITHMS") or
+        [current_app.config["JWT_ALGORITHM"]]
+    )
+
+    results = []
+    valid = []
+    for token in tokens:
+        token = token.removeprefix("Bearer ").strip()
+        try:
+            claims = _decode(token, algorithms)
+            result = {
+                "active": True, "revoked": False,
+                "claims": claims, "error": None
+            }
+            valid.append(result)
+        except jwt.PyJWTError as e:
+            result = {
+                "active": False, "revoked": False,
+                "claims": None, "error": str(e)
+            }
+        results.append(result)
+
+    # Отзыв проверяется одним обращением к Redis на всю пачку
+    revoked = token_blocklist.are_revoked([item["claims"] for item in valid])
+    for item, is_revoked in zip(valid, revoked):
+        if is_revoked:
+            item["active"] = False
+            item["revoked"] = True
+
+    return results
@@ -0,0 +1,35 @@
+from flask import Blueprint, jsonify, request
+from flask.views import MethodView
+
+from authorization.keys import key_manager
+from config import JWKS_CACHE_MAX_AGE
+
+
+jwks_blueprint = Blueprint("JWKS", __name__)
+
+
+class JWKSView(MethodView):
+    """
+    Класс для публикации публичных ключей проверки JWT
+    """
+
+    def get(self):
+        """
+        Набор публичных ключей (JWKS), которыми подписаны действующие токены
+
+        :return: Dict[keys: List[dict]]
+        """
+        response = jsonify(
+            {"keys": [key.to_jwk() for key in key_manager.public_keys()]}
+        )
+        response.cache_control.public = True
+        response.cache_control.max_age = JWKS_CACHE_MAX_AGE
+        response.add_etag()
+
+        return response.make_conditional(request)
+
+
+jwks_blueprint.add_url_rule(
+    "/.well-known/jwks.json",
+    view_func=JWKSView.as_view("jwks")
+)
@@ -0,0 +1,256 @@
+import hashlib
+import json
+import os
+import time
+from threading import Lock
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from config import logger, JWT_KEYS_FILE, JWT_KEYS_RELOAD_INTERVAL, JWT_KEY_ID
+
+
+def _algorithm_for(public_key) -> str:
+    """
+    Алгоритм подписи по умолчанию для типа ключа
+    """
+    if isinstance(public_key, rsa.RSAPublicKey):
+        return "RS256"
+    if isinstance(public_key, ec.EllipticCurvePublicKey):
+        return "ES256"
+    if isinstance(public_key, ed25519.Ed25519PublicKey):
+        return "EdDSA"
+
+    raise ValueError(f"Неподдерживаемый тип ключа: {type(public_key)}")
+
+
+def _key_id_for(public_key) -> str:
+    """
+    Стабильный kid по отпечатку публичного ключа
+    """
+    der = public_key.public_bytes(
+        serialization.Encoding.DER,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return hashlib.sha256(der).hexdigest()[:16]
+
+
+class JWTKey:
+    """
+    Ключ JWT, разобранный из PEM один раз при загрузке
+    """
+
+    def __init__(
+        self,
+        kid: str,
+        algorithm: str,
+        public_key,
+        private_key=None
+    ) -> None:
+        self.kid = kid
+        self.algorithm = algorithm
+        self.public_key = public_key
+        self.private_key = private_key
+
+    @classmethod
+    def from_pem(
+        cls,
+        public_pem: str | None = None,
+        private_pem: str | None = None,
+        kid: str | None = None,
+        algorithm: str | None = None
+    ) -> "JWTKey":
+        private_key = None
+        if private_pem:
+            private_key = serialization.load_pem_private_key(
+                private_pem.encode(), password=None
+            )
+
+        if public_pem:
+            public_key = serialization.load_pem_public_key(public_pem.encode())
+        elif private_key is not None:
+            public_key = private_key.public_key()
+        else:
+            raise ValueError("Не задан ни публичный, ни приватный ключ")
+
+        return cls(
+            kid=kid or _key_id_for(public_key),
+            algorithm=algorithm or _algorithm_for(public_key),
+            public_key=public_key,
+            private_key=private_key
+        )
+
+    def to_jwk(self) -> dict:
+        """
+        Публичная часть ключа в формате JWK (RFC 7517)
+        """
+        jwk = jwt.get_algorithm_by_name(self.algorithm).to_jwk(
+            self.public_key, as_dict=True
+        )
+        jwk.update({"kid": self.kid, "alg": self.algorithm, "use": "sig"})
+        return jwk
+
+    def __repr__(self):
+        return f"<JWTKey {self.kid}: {self.algorithm}>"
+
+
+class SigningKeyManager:
+    """
+    Набор ключей подписи JWT с выбором по kid и горячей перезагрузкой.
+
+    Ключ из JWT_PRIVATE_KEY/JWT_PUBLIC_KEY используется по умолчанию,
+    в том числе для токенов без kid. Ключ профиля compact берется из
+    JWT_EC_PRIVATE_KEY/JWT_EC_PUBLIC_KEY. Дополнительные ключи берутся из
+    JSON-файла JWT_KEYS_FILE вида:
+    {"active": {"RS256": "<kid>"}, "keys": [{"kid": ..., "algorithm": ...,
+    "private_key": "<PEM>", "public_key": "<PEM>"}]}.
+    Ключи без private_key используются только для проверки подписи
+    """
+
+    def __init__(
+        self,
+        keys_file: str | None,
+        reload_interval: int,
+        default_kid: str | None = None
+    ) -> None:
+        self.keys_file = keys_file
+        self.reload_interval = reload_interval
+        self.default_kid = default_kid
+        self._keys: dict[str, JWTKey] = {}
+        self._active: dict[str, str] = {}
+        self._fallback_kid: str | None = None
+        self._file_mtime: float | None = None
+        self._checked_at = 0.0
+        self._lock = Lock()
+        self._load()
+
+    def signing_key(self, algorithm: str) -> JWTKey:
+        """
+        Активный ключ для подписи токенов алгоритмом algorithm
+
+        :param algorithm: алгоритм подписи
+        :return: JWTKey
+        """
+        self._maybe_reload()
+        kid = self._active.get(algorithm)
+        if kid is None:
+            raise RuntimeError(f"Нет активного ключа для алгоритма {algorithm}")
+
+        return self._keys[kid]
+
+    def verification_key(self, kid: str | None):
+        """
+        Публичный ключ для проверки подписи токена по kid из заголовка.
+        Токены без kid или с неизвестным kid проверяются ключом по умолчанию
+
+        :param kid: идентификатор ключа
+        :return: объект публичного ключа
+        """
+        self._maybe_reload()
+        key = self._keys.get(kid) or self._keys.get(self._fallback_kid)
+        if key is None:
+            raise RuntimeError("Нет ключей для проверки подписи JWT")
+
+        return key.public_key
+
+    def public_keys(self) -> list[JWTKey]:
+        """
+        Все ключи, которыми могут быть подписаны действующие токены
+        """
+        self._maybe_reload()
+        return list(self._keys.values())
+
+    def _maybe_reload(self) -> None:
+        if not self.keys_file:
+            return
+
+        now = time.monotonic()
+        if now - self._checked_at < self.reload_interval:
+            return
+
+        with self._lock:
+            if now - self._checked_at < self.reload_interval:
+                return
+            self._checked_at = now
+
+            try:
+                mtime = os.stat(self.keys_file).st_mtime
+            except OSError as e:
+                logger.error(f"[Ключи JWT] Файл ключей недоступен: {e}")
+                return
+
+            if mtime != self._file_mtime:
+                logger.info("[Ключи JWT] Файл ключей изменен, перезагрузка")
+                self._load()
+
+    def _load(self) -> None:
+        keys: dict[str, JWTKey] = {}
+        active: dict[str, str] = {}
+        fallback_kid = None
+
+        try:
+            # RSA ключ профиля rs256 и ключ на эллиптических кривых
+            # профиля compact
+            env_keys = (
+                ("JWT_PRIVATE_KEY", "JWT_PUBLIC_KEY", self.default_kid),
+                ("JWT_EC_PRIVATE_KEY", "JWT_EC_PUBLIC_KEY", None)
+            )
+            for private_env, public_env, kid in env_keys:
+                private_pem = os.getenv(private_env)
+                public_pem = os.getenv(public_env)
+                if not (private_pem or public_pem):
+                    continue
+
+                key = JWTKey.from_pem(
+                    public_pem=public_pem,
+                    private_pem=private_pem,
+                    kid=kid
+                )
+                keys[key.kid] = key
+                if fallback_kid is None:
+                    fallback_kid = key.kid
+                if key.private_key is not None:
+                    active[key.algorithm] = key.kid
+
+            if self.keys_file:
+                self._file_mtime = os.stat(self.keys_file).st_mtime
+                with open(self.keys_file) as f:
+                    data = json.load(f)
+
+                for item in data.get("keys", []):
+                    key = JWTKey.from_pem(
+                        public_pem=item.get("public_key"),
+                        private_pem=item.get("private_key"),
+                        kid=item.get("kid"),
+                        algorithm=item.get("algorithm")
+                    )
+                    keys[key.kid] = key
+
+                for algorithm, kid in data.get("active", {}).items():
+                    if kid not in keys or keys[kid].private_key is None:
+                        raise ValueError(
+                            f"Активный ключ {kid} для {algorithm} "
+                            "не найден или не содержит приватной части"
+                        )
+                    active[algorithm] = kid
+
+                if fallback_kid is None and keys:
+                    fallback_kid = next(iter(keys))
+
+        except (OSError, ValueError, TypeError) as e:
+            # Оставляем прежний набор ключей, чтобы не остановить выпуск токенов
+            logger.error(f"[Ключи JWT] Ошибка загрузки ключей: {e}")
+            return
+
+        # Подмена целиком, чтобы читатели не видели частично загруженный набор
+        self._keys, self._active = keys, active
+        self._fallback_kid = fallback_kid
+        logger.info(f"[Ключи JWT] Загружены ключи: {list(keys.values())}")
+
+
+key_manager = SigningKeyManager(
+    JWT_KEYS_FILE,
+    reload_interval=JWT_KEYS_RELOAD_INTERVAL,
+    default_kid=JWT_KEY_ID
+)
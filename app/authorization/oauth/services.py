@@ -5,7 +5,7 @@ from database.models import UserBase, Role, UserCurrency, DeviceLogin, OAuthProv
 from extensions import device_login_redis
 from authorization.oauth.device_cache import DeviceLoginCache
 
-from kafka.producer import send_message_to_kafka
+from kafka.outbox import enqueue_event
 
 cache = DeviceLoginCache(device_login_redis)
 
@@ -31,10 +31,8 @@ def create_user(
     currency = UserCurrency(user_id=new_user.id)
 
     session_db.add(currency)
-    session_db.commit()
-    session_db.refresh(new_user)
-
-    send_message_to_kafka(
+    enqueue_event(
+        session_db,
         topic="prod.auth.fact.new-user.1",
         payload={
             "user_id": new_user.id,
@@ -45,6 +43,8 @@ def create_user(
         },
         target_service="scoreboard"
     )
+    session_db.commit()
+    session_db.refresh(new_user)
 
     return new_user
 
@@ -0,0 +1,66 @@
+import time
+from threading import Lock
+from typing import Callable
+
+from cache import TTLCache, MISS
+from config import JWT_RENEWAL_CACHE_SIZE, JWT_RENEWAL_LOCKS
+from extensions import jwt_redis_blocklist
+
+
+class TokenRenewalCache:
+    """
+    Дедупликация неявного продления access токенов по jti.
+    Первый запрос выпускает новый токен, остальные запросы с тем же
+    старым токеном получают его же из in-process кэша или из Redis
+    """
+
+    def __init__(self, redis_instance, cache_size: int, locks: int) -> None:
+        self.redis = redis_instance
+        self.cache = TTLCache(cache_size)
+        self._locks = [Lock() for _ in range(locks)]
+
+    @staticmethod
+    def _redis_key(jti: str) -> str:
+        return f"renewed:{jti}"
+
+    def renew(self, jti: str, exp: int, mint: Callable[[], str]) -> str:
+        """
+        Получение продленного токена для jti, выпуск не более одного раза
+
+        :param jti: идентификатор продлеваемого токена
+        :param exp: время истечения продлеваемого токена
+        :param mint: функция выпуска нового токена
+        :return: str
+        """
+        token = self.cache.get(jti)
+        if token is not MISS:
+            return token
+
+        # Параллельные запросы одного воркера ждут первого, а не подписывают
+        # свои токены
+        with self._locks[hash(jti) % len(self._locks)]:
+            token = self.cache.get(jti)
+            if token is not MISS:
+                return token
+
+            ttl = max(int(exp - time.time()), 1)
+            key = self._redis_key(jti)
+
+            token = self.redis.get(key)
+            if token is None:
+                candidate = mint()
+                # Между воркерами выигрывает первый записанный токен
+                if self.redis.set(key, candidate, nx=True, ex=ttl):
+                    token = candidate
+                else:
+                    token = self.redis.get(key) or candidate
+
+            self.cache.set(jti, token, ttl)
+            return token
+
+
+token_renewals = TokenRenewalCache(
+    jwt_redis_blocklist,
+    cache_size=JWT_RENEWAL_CACHE_SIZE,
+    locks=JWT_RENEWAL_LOCKS
+)
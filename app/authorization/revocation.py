@@ -0,0 +1,192 @@
+import json
+import time
+from datetime import timedelta
+from threading import Lock, Thread
+
+from cache import TTLCache, MISS
+from config import (
+    logger,
+    JWT_REFRESH_TOKEN_EXPIRES,
+    JWT_REVOCATION_CHANNEL,
+    JWT_REVOCATION_CACHE_SIZE,
+    JWT_REVOCATION_CACHE_TTL,
+    JWT_REVOCATION_NEGATIVE_TTL
+)
+from extensions import jwt_redis_blocklist
+
+
+class TokenBlocklist:
+    """
+    Двухуровневая проверка отзыва токенов: in-process кэш и Redis.
+    Хранит отзыв отдельных токенов по jti и "эпоху" пользователя -
+    момент, раньше которого все его токены считаются отозванными.
+    Отзывы рассылаются всем воркерам через Redis pub/sub
+    """
+
+    def __init__(
+        self,
+        redis_instance,
+        channel: str,
+        cache_size: int,
+        revoked_ttl: int,
+        negative_ttl: int,
+        epoch_expires: timedelta
+    ) -> None:
+        self.redis = redis_instance
+        self.channel = channel
+        self.revoked_ttl = revoked_ttl
+        self.negative_ttl = negative_ttl
+        self.epoch_expires = epoch_expires
+        self.cache = TTLCache(cache_size)
+        self._listener: Thread | None = None
+        self._listener_lock = Lock()
+        self._subscribed = False
+
+    @staticmethod
+    def _epoch_key(user_id: str | int) -> str:
+        return f"revoked_before:{user_id}"
+
+    def is_revoked(self, jwt_payload: dict) -> bool:
+        """
+        Проверка, отозван ли токен. Redis опрашивается только при промахе
+        кэша, одним MGET для jti и эпохи пользователя
+
+        :param jwt_payload: данные токена
+        :return: bool
+        """
+        return self.are_revoked([jwt_payload])[0]
+
+    def are_revoked(self, jwt_payloads: list[dict]) -> list[bool]:
+        """
+        Проверка отзыва пачки токенов. Все промахи кэша запрашиваются
+        из Redis одним MGET
+
+        :param jwt_payloads: данные токенов
+        :return: List[bool] в порядке jwt_payloads
+        """
+        self._ensure_listener()
+
+        states: dict[str, object] = {}
+        for payload in jwt_payloads:
+            for key in (payload["jti"], self._epoch_key(payload.get("sub"))):
+                if key not in states:
+                    states[key] = self.cache.get(key)
+
+        missing = [key for key, value in states.items() if value is MISS]
+        if missing:
+            for key, raw in zip(missing, self.redis.mget(missing)):
+                if key.startswith("revoked_before:"):
+                    value = int(float(raw)) if raw else None
+                else:
+                    value = raw is not None
+                states[key] = value
+                self._remember(key, value)
+
+        return [
+            bool(states[payload["jti"]]) or self._before_epoch(
+                payload, states[self._epoch_key(payload.get("sub"))]
+            )
+            for payload in jwt_payloads
+        ]
+
+    @staticmethod
+    def _before_epoch(jwt_payload: dict, revoked_before: int | None) -> bool:
+        return (
+            revoked_before is not None and
+            jwt_payload.get("iat", 0) <= revoked_before
+        )
+
+    def revoke(self, jti: str, expires: timedelta | int) -> None:
+        """
+        Отзыв одного токена и оповещение остальных воркеров
+
+        :param jti: идентификатор токена
+        :param expires: время хранения записи об отзыве
+        """
+        self.redis.set(jti, "", ex=expires)
+        self.cache.set(jti, True, self.revoked_ttl)
+        self.redis.publish(self.channel, json.dumps({"jti": jti}))
+
+    def revoke_user(self, user_id: int) -> None:
+        """
+        Отзыв всех access и refresh токенов пользователя, выпущенных
+        до текущего момента. Отозванными считаются токены с iat не позже
+        эпохи, поэтому отзыв завершается только с началом следующей
+        секунды: токены, выпущенные после него, получают iat > эпохи
+
+        :param user_id: id пользователя
+        """
+        epoch_key = self._epoch_key(user_id)
+        # iat хранится в целых секундах, эпоха - текущая секунда целиком
+        revoked_before = int(time.time())
+
+        self.redis.set(epoch_key, revoked_before, ex=self.epoch_expires)
+        self.cache.set(epoch_key, revoked_before, self.revoked_ttl)
+        self.redis.publish(
+            self.channel,
+            json.dumps({"user_id": user_id, "revoked_before": revoked_before})
+        )
+        time.sleep(max(revoked_before + 1 - time.time(), 0))
+
+    def _remember(self, key: str, value: object) -> None:
+        if value:
+            self.cache.set(key, value, self.revoked_ttl)
+        elif self._subscribed:
+            # Отрицательный ответ кэшируем только пока слушаем канал,
+            # иначе пропущенный отзыв жил бы в кэше до истечения TTL.
+            # Отзыв, пришедший по каналу после нашего MGET, не затираем
+            self.cache.add(key, value, self.negative_ttl)
+
+    def _ensure_listener(self) -> None:
+        if self._listener is not None:
+            return
+
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = Thread(target=self._listen, daemon=True)
+                self._listener.start()
+
+    def _listen(self) -> None:
+        while True:
+            pubsub = None
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                # Пока подписки не было, отзывы могли быть пропущены
+                self.cache.clear()
+                self._subscribed = True
+                logger.info(
+                    f"[Отзыв токенов] Подписка на канал '{self.channel}' оформлена"
+                )
+
+                for message in pubsub.listen():
+                    data = json.loads(message["data"])
+                    if "jti" in data:
+                        self.cache.set(data["jti"], True, self.revoked_ttl)
+                    else:
+                        self.cache.set(
+                            self._epoch_key(data["user_id"]),
+                            int(data["revoked_before"]),
+                            self.revoked_ttl
+                        )
+
+            except Exception as e:
+                self._subscribed = False
+                logger.error(
+                    f"[Отзыв токенов] Потеряна подписка на канал '{self.channel}': {e}"
+                )
+                time.sleep(1)
+
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+
+token_blocklist = TokenBlocklist(
+    jwt_redis_blocklist,
+    channel=JWT_REVOCATION_CHANNEL,
+    cache_size=JWT_REVOCATION_CACHE_SIZE,
+    revoked_ttl=JWT_REVOCATION_CACHE_TTL,
+    negative_ttl=JWT_REVOCATION_NEGATIVE_TTL,
+    epoch_expires=JWT_REFRESH_TOKEN_EXPIRES
+)
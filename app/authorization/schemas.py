@@ -1,6 +1,7 @@
 import re
+from typing import List
 from pydantic import BaseModel, field_validator, ValidationError, EmailStr
-from config import logger
+from config import logger, INTROSPECT_MAX_TOKENS
 
 
 def validate_schema(schema_cls: type, **kwargs):
@@ -43,3 +44,18 @@ class UserLoginRequest(BaseModel):
 
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
+
+
+class IntrospectRequest(BaseModel):
+    tokens: List[str]
+
+    @field_validator("tokens")
+    @classmethod
+    def validate_tokens(cls, tokens):
+        if not tokens:
+            raise ValueError("Список токенов пуст")
+        if len(tokens) > INTROSPECT_MAX_TOKENS:
+            raise ValueError(
+                f"Не более {INTROSPECT_MAX_TOKENS} токенов за один запрос"
+            )
+        return tokens
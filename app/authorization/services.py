@@ -1,8 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import BoundedSemaphore
+from sqlalchemy import Row, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import Session
-from database.models import UserBase, UserCurrency
+from database.database import session
+from database.models import Role, UserBase, UserCurrency
 from sqlalchemy.exc import SQLAlchemyError
-from werkzeug.security import generate_password_hash
-from kafka.producer import send_message_to_kafka
+from config import logger, PASSWORD_HASH_QUEUE_LIMIT
+from errors import HttpError
+from hashing import password_hasher
+from kafka.outbox import enqueue_event
+
+
+rehash_executor = ThreadPoolExecutor(max_workers=1)
+rehash_slots = BoundedSemaphore(PASSWORD_HASH_QUEUE_LIMIT)
 
 
 def get_user_by_username(
@@ -20,26 +32,57 @@ def get_user_by_username(
     return user
 
 
-def create_user(
+def register_user(
     session_db: Session,
     user_data: dict
-) -> UserBase | Exception:
+) -> Row | None:
     """
-    Создание пользователя
+    Создание пользователя и его валют одним запросом.
+    Пользователь вставляется через INSERT ... ON CONFLICT DO NOTHING RETURNING,
+    строка валют - из его результата в том же запросе
+
+    :param session_db: сессия базы данных
+    :param user_data: данные пользователя
+    :return: Row(id, username, email, role) | None, если username или email заняты
     """
     try:
         password = user_data.pop("password")
-        user_data["h_password"] = generate_password_hash(password)
-        user = UserBase(**user_data)
-        session_db.add(user)
-        session_db.flush()
+        now = datetime.utcnow()
 
-        currency = UserCurrency(user_id=user.id)
-        session_db.add(currency)
-        session_db.commit()
-        session_db.refresh(user)
+        new_user = (
+            pg_insert(UserBase)
+            .values(
+                **user_data,
+                h_password=password_hasher.generate(password),
+                is_active=False,
+                role=Role.USER,
+                created_at=now
+            )
+            .on_conflict_do_nothing()
+            .returning(
+                UserBase.id, UserBase.username, UserBase.email, UserBase.role
+            )
+            .cte("new_user")
+        )
+        new_currency = (
+            insert(UserCurrency)
+            .from_select(
+                ["user_id", "gold", "guild_rage", "created_at"],
+                select(new_user.c.id, literal(0), literal(0), literal(now))
+            )
+            .cte("new_currency")
+        )
 
-        send_message_to_kafka(
+        user = session_db.execute(
+            select(new_user).add_cte(new_currency)
+        ).first()
+
+        if user is None:
+            session_db.rollback()
+            return None
+
+        enqueue_event(
+            session_db,
             topic="prod.auth.fact.new-user.1",
             payload={
                 "user_id": user.id,
@@ -50,9 +93,50 @@ def create_user(
             },
             target_service="scoreboard"
         )
+        session_db.commit()
 
         return user
 
     except SQLAlchemyError as e:
         session_db.rollback()
         raise e
+
+
+def rehash_password(user_id: int, old_hash: str, password: str) -> None:
+    """
+    Пересчет хэша пароля с текущими параметрами. Хэш заменяется, только
+    если пароль не успели сменить
+    """
+    try:
+        new_hash = password_hasher.generate(password)
+        with session() as session_db:
+            session_db.execute(
+                update(UserBase)
+                .where(UserBase.id == user_id, UserBase.h_password == old_hash)
+                .values(h_password=new_hash)
+            )
+            session_db.commit()
+
+        logger.info(f"Хэш пароля пользователя {user_id} обновлен")
+
+    except (HttpError, SQLAlchemyError) as e:
+        logger.warning(
+            f"Не удалось обновить хэш пароля пользователя {user_id}: {e}"
+        )
+
+    finally:
+        rehash_slots.release()
+
+
+def schedule_password_rehash(user: UserBase, password: str) -> None:
+    """
+    Фоновое обновление хэша пароля, полученного с устаревшими параметрами
+    """
+    if not password_hasher.needs_rehash(user.h_password):
+        return
+
+    # При всплеске входов пересчет откладывается до следующего входа
+    if not rehash_slots.acquire(blocking=False):
+        return
+
+    rehash_executor.submit(rehash_password, user.id, user.h_password, password)
@@ -0,0 +1,66 @@
+from config import JWT_TOKEN_PROFILE, JWT_COMPACT_ALGORITHM
+
+
+# Профили токенов: алгоритм подписи и имена пользовательских claims
+TOKEN_PROFILES = {
+    "rs256": {
+        "algorithm": "RS256",
+        "claims": {
+            "username": "username",
+            "role": "role",
+            "is_active": "is_active"
+        }
+    },
+    "compact": {
+        "algorithm": JWT_COMPACT_ALGORITHM,
+        "claims": {
+            "username": "u",
+            "role": "r",
+            "is_active": "a"
+        }
+    }
+}
+
+token_profile = TOKEN_PROFILES[JWT_TOKEN_PROFILE]
+
+
+def decode_algorithms() -> list[str]:
+    """
+    Алгоритмы всех профилей, чтобы на время миграции принимались
+    токены любого из них
+    """
+    return sorted({profile["algorithm"] for profile in TOKEN_PROFILES.values()})
+
+
+def user_claims(username: str, role: str, is_active: bool) -> dict:
+    """
+    Пользовательские claims в именах активного профиля
+
+    :param username: имя пользователя
+    :param role: роль пользователя
+    :param is_active: подтвержден ли email
+    :return: dict
+    """
+    names = token_profile["claims"]
+    return {
+        names["username"]: username,
+        names["role"]: role,
+        names["is_active"]: is_active
+    }
+
+
+def read_user_claims(claims: dict) -> dict:
+    """
+    Пользовательские claims токена любого профиля в полных именах
+
+    :param claims: данные токена
+    :return: Dict[username, role, is_active]
+    """
+    for profile in TOKEN_PROFILES.values():
+        names = profile["claims"]
+        if names["username"] in claims:
+            return {
+                field: claims.get(name) for field, name in names.items()
+            }
+
+    return {"username": None, "role": None, "is_active": None}
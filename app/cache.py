@@ -0,0 +1,77 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+MISS = object()
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру in-process LRU кэш с TTL записей
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[object, float]] = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: str) -> object:
+        """
+        Получение значения из кэша
+
+        :param key: ключ записи
+        :return: значение или MISS, если записи нет или она устарела
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISS
+
+            value, expires_at = entry
+            if expires_at <= now:
+                del self._entries[key]
+                return MISS
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: object, ttl: float) -> None:
+        """
+        Сохранение значения в кэш с вытеснением самых старых записей
+
+        :param key: ключ записи
+        :param value: значение
+        :param ttl: время жизни записи в секундах
+        """
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def add(self, key: str, value: object, ttl: float) -> bool:
+        """
+        Сохранение значения, только если действующей записи по ключу нет
+
+        :param key: ключ записи
+        :param value: значение
+        :param ttl: время жизни записи в секундах
+        :return: True, если значение сохранено
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+
+            self._entries[key] = (value, now + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 from logging.handlers import RotatingFileHandler
@@ -26,9 +27,6 @@ POSTGRES_DB = os.getenv("POSTGRES_DB")
 
 VERSION = "1.1.10"
 
-JWT_ACCESS_BLOCKLIST = timedelta(
-    hours=int(os.getenv("JWT_ACCESS_BLOCKLIST", 1))
-)
 JWT_ACCESS_TOKEN_EXPIRES = timedelta(
     days=int(os.getenv("JWT_ACCESS_TOKEN_EXPIRES", 1))
 )
@@ -36,6 +34,101 @@ JWT_REFRESH_TOKEN_EXPIRES = timedelta(
     days=int(os.getenv("JWT_REFRESH_TOKEN_EXPIRES", 7))
 )
 
+# Профиль выпускаемых токенов: rs256 или compact (короткие claims и
+# подпись на эллиптических кривых)
+JWT_TOKEN_PROFILE = os.getenv("JWT_TOKEN_PROFILE", "rs256")
+JWT_COMPACT_ALGORITHM = os.getenv("JWT_COMPACT_ALGORITHM", "ES256")
+
+# Файл с дополнительными ключами подписи JWT для ротации
+JWT_KEYS_FILE = os.getenv("JWT_KEYS_FILE")
+JWT_KEYS_RELOAD_INTERVAL = int(os.getenv("JWT_KEYS_RELOAD_INTERVAL", 30))
+JWT_KEY_ID = os.getenv("JWT_KEY_ID")
+# Время кэширования JWKS у потребителей (в секундах)
+JWKS_CACHE_MAX_AGE = int(os.getenv("JWKS_CACHE_MAX_AGE", 3600))
+
+# Окно неявного продления access токена до его истечения (в минутах)
+JWT_RENEWAL_WINDOW = timedelta(
+    minutes=int(os.getenv("JWT_RENEWAL_WINDOW", 30))
+)
+JWT_RENEWAL_CACHE_SIZE = int(os.getenv("JWT_RENEWAL_CACHE_SIZE", 10_000))
+JWT_RENEWAL_LOCKS = int(os.getenv("JWT_RENEWAL_LOCKS", 64))
+
+# Размер кэша проверенных токенов, 0 - кэш выключен
+JWT_DECODE_CACHE_SIZE = int(os.getenv("JWT_DECODE_CACHE_SIZE", 0))
+
+INTROSPECT_MAX_TOKENS = int(os.getenv("INTROSPECT_MAX_TOKENS", 100))
+# Токен внутренних сервисов для /introspect/ (заголовок X-Service-Token),
+# если не задан - эндпоинт отклоняет все запросы
+INTROSPECT_SERVICE_TOKEN = os.getenv("INTROSPECT_SERVICE_TOKEN")
+# Токен Prometheus для /metrics (заголовок Authorization: Bearer),
+# если не задан - метрики не отдаются
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+JWT_REVOCATION_CHANNEL = os.getenv("JWT_REVOCATION_CHANNEL", "jwt-revocations")
+JWT_REVOCATION_CACHE_SIZE = int(
+    os.getenv("JWT_REVOCATION_CACHE_SIZE", 100_000)
+)
+# Время жизни записей кэша отзыва (в секундах)
+JWT_REVOCATION_CACHE_TTL = int(os.getenv("JWT_REVOCATION_CACHE_TTL", 300))
+JWT_REVOCATION_NEGATIVE_TTL = int(
+    os.getenv("JWT_REVOCATION_NEGATIVE_TTL", 30)
+)
+
+# Метод хэширования паролей werkzeug, например "scrypt:65536:8:1".
+# Если не задан, берется из файла калибровки (python hash_calibration.py)
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD")
+PASSWORD_HASH_PARAMS_FILE = os.getenv(
+    "PASSWORD_HASH_PARAMS_FILE", "hash_params.json"
+)
+
+# Пул процессов для хэширования паролей
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", max((os.cpu_count() or 2) // 2, 1))
+)
+# Сколько запросов может ждать свободный процесс, остальные получают 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 32))
+PASSWORD_HASH_TIMEOUT = int(os.getenv("PASSWORD_HASH_TIMEOUT", 10))
+
+
+def _rate_limit(name: str, default: str) -> tuple[int, int]:
+    """
+    Лимит вида "<число запросов>/<окно в секундах>"
+    """
+    limit, window = os.getenv(name, default).split("/")
+    return int(limit), int(window)
+
+
+# Лимиты частоты запросов по эндпоинтам: по IP клиента и по имени пользователя
+RATE_LIMITS = {
+    "Auth.login": {
+        "ip": _rate_limit("RATE_LIMIT_LOGIN_IP", "30/60"),
+        "username": _rate_limit("RATE_LIMIT_LOGIN_USERNAME", "5/60"),
+    },
+    "Auth.registration": {
+        "ip": _rate_limit("RATE_LIMIT_REGISTRATION_IP", "5/600"),
+    },
+    "Auth.introspect": {
+        "ip": _rate_limit("RATE_LIMIT_INTROSPECT_IP", "600/60"),
+    },
+}
+# Число доверенных прокси (ingress) перед приложением для X-Forwarded-For
+RATE_LIMIT_PROXY_HOPS = int(os.getenv("RATE_LIMIT_PROXY_HOPS", 0))
+
+# Подпись кодов подтверждения email и срок их действия (в секундах)
+CONFIRM_EMAIL_SECRET = os.getenv(
+    "CONFIRM_EMAIL_SECRET", os.getenv("FLASK_SECRET_KEY")
+)
+CONFIRM_EMAIL_TOKEN_TTL = int(os.getenv("CONFIRM_EMAIL_TOKEN_TTL", 60*60*24*3))
+
+# Очередь писем: число воркеров, размер пачки и повторы с backoff (в секундах)
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 20))
+MAIL_MAX_ATTEMPTS = int(os.getenv("MAIL_MAX_ATTEMPTS", 5))
+MAIL_RETRY_BACKOFF = int(os.getenv("MAIL_RETRY_BACKOFF", 10))
+MAIL_VISIBILITY_TIMEOUT = int(os.getenv("MAIL_VISIBILITY_TIMEOUT", 300))
+MAIL_CONNECTION_IDLE = int(os.getenv("MAIL_CONNECTION_IDLE", 60))
+MAIL_POLL_INTERVAL = float(os.getenv("MAIL_POLL_INTERVAL", 0.5))
+
 SERVER_ADDRESS = os.getenv("SERVER_ADDRESS")
 
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID")
@@ -50,3 +143,76 @@ YANDEX_AUTH_URL = f"{SERVER_ADDRESS}/api/v1/auth/login/yandex"
 YANDEX_REDIRECT_URL = f"{SERVER_ADDRESS}/api/v1/auth/yandex/device/verify"
 
 KAFKA_ADDRESS = os.getenv("KAFKA_ADDRESS")
+# Пачка консьюмера: сколько сообщений читать за раз и сколько ждать (в секундах)
+KAFKA_CONSUME_BATCH_SIZE = int(os.getenv("KAFKA_CONSUME_BATCH_SIZE", 100))
+KAFKA_CONSUME_TIMEOUT = float(os.getenv("KAFKA_CONSUME_TIMEOUT", 1.0))
+# Параллельная обработка: число очередей группы воркеров по умолчанию
+# (сообщения пользователя всегда попадают в одну) и размер каждой, при
+# заполнении чтение топиков группы ставится на паузу
+KAFKA_LANES = int(os.getenv("KAFKA_LANES", 4))
+KAFKA_LANE_QUEUE_SIZE = int(os.getenv("KAFKA_LANE_QUEUE_SIZE", 500))
+# Переопределение реестра обработчиков, JSON вида
+# {"<группа>": {"workers": 8, "batch_size": 50, "queue_size": 500}} и
+# {"<топик>": {"retries": 3, "retry_backoff": 0.5}}
+KAFKA_WORKER_GROUPS = json.loads(os.getenv("KAFKA_WORKER_GROUPS", "{}"))
+KAFKA_TOPIC_SETTINGS = json.loads(os.getenv("KAFKA_TOPIC_SETTINGS", "{}"))
+# Ответы на уже обработанные операции: размер LRU и срок хранения в Redis (в секундах)
+KAFKA_IDEMPOTENCY_CACHE_SIZE = int(os.getenv("KAFKA_IDEMPOTENCY_CACHE_SIZE", 100_000))
+KAFKA_IDEMPOTENCY_TTL = int(os.getenv("KAFKA_IDEMPOTENCY_TTL", 60*60*24*7))
+# kafka - кластер Kafka, memory - брокер в памяти процесса для бенчмарков
+KAFKA_BACKEND = os.getenv("KAFKA_BACKEND", "kafka")
+
+# Асинхронный продюсер: без flush после каждого сообщения, доставка
+# подтверждается в фоновом потоке. Батчинг и сжатие настраиваются
+KAFKA_PRODUCER_ASYNC = os.getenv("KAFKA_PRODUCER_ASYNC", "true").lower() == "true"
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", 5))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", 64 * 1024))
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")
+KAFKA_FLUSH_TIMEOUT = float(os.getenv("KAFKA_FLUSH_TIMEOUT", 10))
+# Сжатие для отдельных топиков, JSON вида {"<топик>": "zstd"}
+KAFKA_TOPIC_COMPRESSION = json.loads(
+    os.getenv("KAFKA_TOPIC_COMPRESSION", "{}")
+)
+# Топики, где важно только последнее значение по ключу, JSON вида
+# {"<топик>": "<поле ключа>"}: сообщения копятся окно в миллисекундах
+# (0 - без объединения) и отправляются по одному на ключ
+KAFKA_COALESCED_TOPICS = json.loads(
+    os.getenv(
+        "KAFKA_COALESCED_TOPICS",
+        '{"prod.auth.fact.currency-change.1": "user_id"}'
+    )
+)
+KAFKA_COALESCE_WINDOW_MS = int(os.getenv("KAFKA_COALESCE_WINDOW_MS", 200))
+KAFKA_COALESCE_MAX_PENDING = int(os.getenv("KAFKA_COALESCE_MAX_PENDING", 1000))
+# Сериализация сообщений: json, orjson или auto (orjson, если установлен)
+KAFKA_SERIALIZER = os.getenv("KAFKA_SERIALIZER", "auto")
+
+# Outbox событий: размер пачки релея, опрос (в секундах) и хранение отправленных
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 100))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 0.5))
+OUTBOX_FLUSH_TIMEOUT = float(os.getenv("OUTBOX_FLUSH_TIMEOUT", 10))
+# После стольких ошибок доставки событие откладывается в сторону (failed_at),
+# чтобы не блокировать публикацию следующих событий
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 10))
+OUTBOX_RETENTION = timedelta(
+    days=int(os.getenv("OUTBOX_RETENTION_DAYS", 7))
+)
+# Отложенные (failed_at) события хранятся дольше, чтобы их можно было
+# разобрать и вернуть в очередь скриптом outbox_requeue.py
+OUTBOX_FAILED_RETENTION = timedelta(
+    days=int(os.getenv("OUTBOX_FAILED_RETENTION_DAYS", 30))
+)
+OUTBOX_CLEANUP_INTERVAL = int(os.getenv("OUTBOX_CLEANUP_INTERVAL", 3600))
+
+# Зависшие резервирования: через сколько секунд RESERVED транзакция
+# завершается по политике charge (списание фиксируется, EXPIRED) или refund
+# (возврат средств, FAILED), размер пачки и интервал проверки (в секундах).
+# Подтверждения покупки в протоколе нет, поэтому refund вернет средства
+# и за состоявшиеся покупки
+
+RESERVATION_TTL = timedelta(
+    seconds=int(os.getenv("RESERVATION_TTL", 60*60*24))
+)
+RESERVATION_EXPIRY_POLICY = os.getenv("RESERVATION_EXPIRY_POLICY", "charge")
+RESERVATION_SWEEP_BATCH_SIZE = int(os.getenv("RESERVATION_SWEEP_BATCH_SIZE", 500))
+RESERVATION_SWEEP_INTERVAL = float(os.getenv("RESERVATION_SWEEP_INTERVAL", 60))
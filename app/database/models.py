@@ -1,7 +1,9 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from sqlalchemy import (
-    String, Integer, Enum as SQLEnum, ForeignKey, DateTime, Boolean
+    String, Integer, Enum as SQLEnum, ForeignKey, DateTime, Boolean, Index,
+    text
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime
 from enum import Enum
 
@@ -23,6 +25,9 @@ class TransactionStatus(Enum):
     DECLINED = "declined"
     COMPLETED = "completed"
     FAILED = "failed"
+    # Резервирование истекло без компенсации, списание зафиксировано.
+    # Поздняя компенсация все еще возвращает средства
+    EXPIRED = "expired"
 
 
 class OAuthProvider(Enum):
@@ -104,6 +109,10 @@ class UserCurrency(Base):
 
 class UserTransaction(Base):
     __tablename__ = "user_transactions"
+    __table_args__ = (
+        # Поиск зависших резервирований: статус и время создания
+        Index("ix_user_transactions_status_created_at", "status", "created_at"),
+    )
 
     transaction_id: Mapped[str] = mapped_column(
         String(64),
@@ -156,3 +165,36 @@ class DeviceLogin(Base):
             f"<DeviceLogin {self.device_code}, user_code={self.user_code}, "
             f"user_id={self.user_id}, verified={self.is_verified}>"
         )
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox"
+    __table_args__ = (
+        # Релей читает только неотправленные события в порядке id
+        Index(
+            "ix_outbox_unsent",
+            "id",
+            postgresql_where=text("sent_at IS NULL AND failed_at IS NULL")
+        ),
+    )
+
+    topic: Mapped[str] = mapped_column(String(255), nullable=False)
+    payload: Mapped[dict] = mapped_column(JSONB, nullable=False)
+    target_service: Mapped[str] = mapped_column(String(50), default="?")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    sent_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    # Неудачные попытки публикации. После OUTBOX_MAX_ATTEMPTS событие
+    # помечается failed_at и больше не задерживает следующие события
+    attempts: Mapped[int] = mapped_column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+    last_error: Mapped[str] = mapped_column(String(255), nullable=True)
+    failed_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return (
+            f"<OutboxEvent {self.id}: {self.topic}, "
+            f"sent_at={self.sent_at}, failed_at={self.failed_at}>"
+        )
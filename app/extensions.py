@@ -27,3 +27,24 @@ confirm_code_redis = redis.StrictRedis(
     db=2,
     decode_responses=True
 )
+
+rate_limit_redis = redis.StrictRedis(
+    host=CACHE_REDIS_HOST,
+    port=CACHE_REDIS_PORT,
+    db=3,
+    decode_responses=True
+)
+
+mail_queue_redis = redis.StrictRedis(
+    host=CACHE_REDIS_HOST,
+    port=CACHE_REDIS_PORT,
+    db=4,
+    decode_responses=True
+)
+
+idempotency_redis = redis.StrictRedis(
+    host=CACHE_REDIS_HOST,
+    port=CACHE_REDIS_PORT,
+    db=5,
+    decode_responses=True
+)
@@ -0,0 +1,86 @@
+"""
+Калибровка стоимости хэширования паролей под CPU текущего хоста.
+
+Подбирает максимальные параметры, при которых хэширование укладывается
+в целевое время, и записывает их в PASSWORD_HASH_PARAMS_FILE:
+    python hash_calibration.py --target-ms 250 --algorithm scrypt
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from werkzeug.security import generate_password_hash
+
+from config import PASSWORD_HASH_PARAMS_FILE
+
+
+def measure(method: str, rounds: int) -> float:
+    """
+    Медианное время хэширования методом method (в миллисекундах)
+    """
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        generate_password_hash("calibration-Passw0rd", method)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    return statistics.median(timings)
+
+
+def candidates(algorithm: str, max_memory_mb: int):
+    """
+    Параметры по возрастанию стоимости
+    """
+    if algorithm == "scrypt":
+        # scrypt memory-hard: память растет как 128 * n * r байт
+        n = 2**14
+        while 128 * n * 8 <= max_memory_mb * 1024 * 1024:
+            yield f"scrypt:{n}:8:1"
+            n *= 2
+    else:
+        iterations = 100_000
+        while iterations <= 10_000_000:
+            yield f"pbkdf2:sha256:{iterations}"
+            iterations = int(round(iterations * 1.25, -4))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument(
+        "--algorithm", choices=("scrypt", "pbkdf2"), default="scrypt"
+    )
+    parser.add_argument("--max-memory-mb", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--output", default=PASSWORD_HASH_PARAMS_FILE)
+    args = parser.parse_args()
+
+    chosen = None
+    for method in candidates(args.algorithm, args.max_memory_mb):
+        elapsed = measure(method, args.rounds)
+        print(f"{method}: {elapsed:.1f} мс")
+        if elapsed > args.target_ms:
+            break
+        chosen = (method, elapsed)
+
+    if chosen is None:
+        raise SystemExit(
+            "Даже минимальные параметры не укладываются в целевое время"
+        )
+
+    method, elapsed = chosen
+    with open(args.output, "w") as f:
+        json.dump({
+            "method": method,
+            "measured_ms": round(elapsed, 1),
+            "target_ms": args.target_ms,
+            "calibrated_at": datetime.now(timezone.utc).isoformat()
+        }, f, indent=2)
+
+    print(f"Выбран метод {method} ({elapsed:.1f} мс), записан в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
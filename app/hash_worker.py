@@ -0,0 +1,18 @@
+"""
+Код процессов пула хэширования паролей.
+
+Модуль предзагружается forkserver вместо __main__ и не должен
+импортировать приложение: процессы пула получают только werkzeug
+"""
+import time
+
+import werkzeug.security # noqa
+
+
+def timed(func, *args) -> tuple[float, float, object]:
+    """
+    Выполнение функции хэширования в процессе пула с замером времени
+    """
+    started = time.time()
+    result = func(*args)
+    return started, time.time() - started, result
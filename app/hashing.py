@@ -0,0 +1,179 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from threading import BoundedSemaphore, Lock
+
+from werkzeug.security import (
+    generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+)
+
+from config import (
+    logger,
+    PASSWORD_HASH_METHOD,
+    PASSWORD_HASH_PARAMS_FILE,
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_LIMIT,
+    PASSWORD_HASH_TIMEOUT
+)
+from errors import HttpError
+from hash_worker import timed
+from metrics import Counter, Histogram
+
+
+hash_queue_seconds = Histogram(
+    "password_hash_queue_seconds",
+    "Время ожидания свободного процесса для хэширования пароля"
+)
+hash_seconds = Histogram(
+    "password_hash_seconds",
+    "Время вычисления хэша пароля"
+)
+hash_rejected = Counter(
+    "password_hash_rejected_total",
+    "Запросы, отклоненные из-за переполненной очереди хэширования"
+)
+
+
+def normalize_method(method: str) -> str:
+    """
+    Полная запись метода хэширования werkzeug с параметрами по умолчанию,
+    в том виде, в котором она хранится в начале хэша
+
+    :param method: метод, например "scrypt" или "pbkdf2:sha256:600000"
+    :return: str
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = args if args else (2**15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2":
+        hash_name = args[0] if args else "sha256"
+        iterations = args[1] if len(args) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+
+    raise ValueError(f"Неподдерживаемый метод хэширования: {method}")
+
+
+def load_hash_method() -> str:
+    """
+    Метод хэширования: из PASSWORD_HASH_METHOD, иначе из файла
+    калибровки PASSWORD_HASH_PARAMS_FILE, иначе scrypt по умолчанию
+    """
+    if PASSWORD_HASH_METHOD:
+        return normalize_method(PASSWORD_HASH_METHOD)
+
+    if os.path.exists(PASSWORD_HASH_PARAMS_FILE):
+        try:
+            with open(PASSWORD_HASH_PARAMS_FILE) as f:
+                return normalize_method(json.load(f)["method"])
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"[Хэширование] Ошибка чтения файла калибровки: {e}")
+
+    return normalize_method("scrypt")
+
+
+class PasswordHasher:
+    """
+    Хэширование паролей в отдельном пуле процессов ограниченного размера,
+    чтобы всплеск входов не занимал CPU потоков обработки запросов.
+    При заполненной очереди запрос сразу отклоняется с кодом 503
+    """
+
+    def __init__(
+        self,
+        method: str,
+        workers: int,
+        queue_limit: int,
+        timeout: int
+    ) -> None:
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(workers + queue_limit)
+        self._executor: ProcessPoolExecutor | None = None
+        self._executor_lock = Lock()
+
+    def generate(self, password: str) -> str:
+        """
+        Хэширование пароля
+
+        :param password: пароль
+        :return: str
+        """
+        return self._run(generate_password_hash, password, self.method)
+
+    def check(self, pwhash: str, password: str) -> bool:
+        """
+        Проверка пароля по хэшу
+
+        :param pwhash: хэш пароля
+        :param password: пароль
+        :return: bool
+        """
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """
+        Хэш получен с параметрами, отличными от текущих
+
+        :param pwhash: хэш пароля
+        :return: bool
+        """
+        return pwhash.split("$", 1)[0] != self.method
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    # fork из процесса с потоками Kafka, Redis и почты может
+                    # унаследовать захваченные блокировки. forkserver
+                    # предзагружает только легкий hash_worker и порождает
+                    # процессы пула из себя (точка входа - server.py)
+                    context = multiprocessing.get_context("forkserver")
+                    context.set_forkserver_preload(["hash_worker"])
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=context
+                    )
+
+        return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            hash_rejected.inc()
+            logger.warning("[Хэширование] Очередь хэширования паролей заполнена")
+            raise HttpError(503, "Service is overloaded, try again later")
+
+        submitted = time.time()
+        try:
+            future = self._get_executor().submit(timed, func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+
+        # Место в очереди освобождается, только когда задача завершена или
+        # отменена, иначе задачи с истекшим ожиданием копились бы в пуле
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            started, duration, result = future.result(timeout=self.timeout)
+
+        except FutureTimeoutError:
+            future.cancel()
+            logger.error("[Хэширование] Превышено время ожидания хэширования")
+            raise HttpError(503, "Service is overloaded, try again later")
+
+        hash_queue_seconds.observe(max(started - submitted, 0))
+        hash_seconds.observe(duration)
+
+        return result
+
+
+password_hasher = PasswordHasher(
+    method=load_hash_method(),
+    workers=PASSWORD_HASH_WORKERS,
+    queue_limit=PASSWORD_HASH_QUEUE_LIMIT,
+    timeout=PASSWORD_HASH_TIMEOUT
+)
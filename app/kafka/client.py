@@ -0,0 +1,31 @@
+from confluent_kafka import Consumer, Producer
+
+from config import KAFKA_BACKEND
+from kafka.memory_broker import MemoryConsumer, MemoryProducer
+
+
+def create_producer(config: dict):
+    """
+    Продюсер выбранного бэкенда: kafka - confluent_kafka, memory - брокер
+    в памяти процесса для нагрузочных замеров
+
+    :param config: настройки продюсера librdkafka
+    :return: Producer | MemoryProducer
+    """
+    if KAFKA_BACKEND == "memory":
+        return MemoryProducer(config)
+
+    return Producer(config)
+
+
+def create_consumer(config: dict):
+    """
+    Консьюмер выбранного бэкенда
+
+    :param config: настройки консьюмера librdkafka
+    :return: Consumer | MemoryConsumer
+    """
+    if KAFKA_BACKEND == "memory":
+        return MemoryConsumer(config)
+
+    return Consumer(config)
@@ -0,0 +1,86 @@
+import time
+from threading import Condition, Lock, Thread
+from typing import Callable
+
+from config import logger
+from metrics import Counter
+
+
+coalesced_total = Counter(
+    "kafka_coalesced_total",
+    "Сообщения, замененные более новым значением до отправки"
+)
+
+
+class CoalescingPublisher:
+    """
+    Объединение сообщений топика, для которого важно только последнее
+    значение по ключу. Сообщения копятся не дольше окна и отправляются
+    по одному на ключ, самое новое. При max_pending ключей пачка
+    отправляется сразу
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        key_field: str,
+        window: float,
+        max_pending: int,
+        send: Callable[[str, dict, str], None]
+    ) -> None:
+        self.topic = topic
+        self.key_field = key_field
+        self.window = window
+        self.max_pending = max_pending
+        self.send = send
+        self._pending: dict[object, tuple[dict, str]] = {}
+        self._condition = Condition()
+        # Снимок и отправка под одной блокировкой: иначе отправка по
+        # заполнению и по окну могли бы обогнать друг друга, и старое
+        # значение ключа ушло бы после нового
+        self._flush_lock = Lock()
+        self._thread: Thread | None = None
+
+    def publish(self, payload: dict, target_service: str) -> None:
+        with self._condition:
+            key = payload.get(self.key_field)
+            if key in self._pending:
+                coalesced_total.inc()
+            else:
+                self._condition.notify()
+            self._pending[key] = (payload, target_service)
+            full = len(self._pending) >= self.max_pending
+
+            if self._thread is None:
+                self._thread = Thread(
+                    target=self._run, name=f"kafka-coalesce-{self.topic}", daemon=True
+                )
+                self._thread.start()
+
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Отправка накопленных сообщений
+        """
+        with self._flush_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+
+            for payload, target_service in pending.values():
+                try:
+                    self.send(self.topic, payload, target_service)
+                except Exception as e:
+                    logger.error(
+                        f"[Kafka Продюсер] Ошибка при отправке объединенного сообщения в '{self.topic}': {e}"
+                    )
+
+    def _run(self) -> None:
+        # Окно отсчитывается от первого сообщения после прошлой отправки
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            time.sleep(self.window)
+            self.flush()
@@ -1,85 +1,312 @@
-import json
+import time
+from collections import deque
+from itertools import groupby
+from operator import itemgetter
+
+from pydantic import ValidationError
 
-from confluent_kafka import Consumer
 from database.database import session
-from config import logger, KAFKA_ADDRESS
-from kafka.handlers.shop.balance_reserve import handle_balance_reserve
-from kafka.handlers.shop.balance_compensate import handle_balance_compensate
-from kafka.handlers.guild.guild_war_declare import handle_guild_war_declare
-from kafka.handlers.guild.guild_war_compensate import handle_guild_war_compensate
+from config import (
+    logger,
+    KAFKA_ADDRESS,
+    KAFKA_CONSUME_BATCH_SIZE,
+    KAFKA_CONSUME_TIMEOUT
+)
+from kafka.client import create_consumer
+from kafka.lanes import MessageLanes, OffsetTracker
+from kafka.producer import deferred_messages
+from kafka.registry import TOPICS, WORKER_GROUPS
+from kafka.serializers import serializer, DecodeError
+from kafka.services import prefetch_user_currencies, prefetch_transactions
 
 
-def start_consumer_loop() -> None:
-    consumer = Consumer({
-        "bootstrap.servers": KAFKA_ADDRESS,
-        "group.id": "auth-service-group",
-        "auto.offset.reset": "earliest"
-    })
-    consumer.subscribe([
-        "shop.balance.reserve.request.auth",
-        "shop.balance.compensate.request.auth",
-        "initiator_guild_wants_declare_war",
-        "guild_war_canceled_declined_expired"
-    ])
-
-    logger.info("[Kafka Консьюмер] Запущен обработчик транзакций...")
-    while True:
+def decode_message(msg) -> tuple[str, dict] | None:
+    """
+    Разбор сообщения Kafka
+
+    :return: (топик, данные) или None, если сообщение нужно пропустить
+    """
+    if msg.error():
+        logger.error(f"[Kafka Консьюмер] Ошибка брокера: {msg.error()}")
+        return None
+
+    value = msg.value()
+    if not value:
+        logger.warning(
+            f"[Kafka Консьюмер] Пустое сообщение на топике '{msg.topic()}', пропуск"
+        )
+        return None
+
+    if value.startswith(b"Subscribed topic not available"):
+        logger.error(f"[Kafka Консьюмер] Ошибка брокера: {value!r}")
+        return None
+
+    topic_handler = TOPICS.get(msg.topic())
+    if topic_handler is None:
+        logger.warning(f"[Kafka Консьюмер] Неизвестный топик: {msg.topic()}")
+        return None
+
+    try:
+        data = serializer.loads(value)
+    except DecodeError as e:
+        logger.error(
+            f"[Kafka Консьюмер] Ошибка парсинга JSON: {e}: {value!r}")
+        return None
+
+    try:
+        data = topic_handler.schema.model_validate(data).model_dump()
+    except ValidationError as e:
+        logger.error(
+            f"[Kafka Консьюмер] Сообщение на топике '{msg.topic()}' не прошло "
+            f"проверку схемы: {e}: {value!r}"
+        )
+        return None
+
+    logger.info(
+        f"[Kafka Консьюмер] Получено сообщение на топике '{msg.topic()}': {data}"
+    )
+    return msg.topic(), data
+
+
+def message_user_id(data: dict):
+    return data.get("user_id", data.get("initiator_owner_id"))
+
+
+# Ошибки данных сообщения (например, неизвестный currency_type):
+# повтор не поможет, сообщение сразу отбрасывается
+PERMANENT_ERRORS = (LookupError, ValueError, TypeError)
+
+
+def process_batch(messages: list[tuple[str, dict]]) -> None:
+    """
+    Применение пачки сообщений в одной транзакции. Каждое сообщение
+    обрабатывается в своей точке сохранения, ошибка откатывает только его,
+    и оно сразу повторяется, до следующих сообщений того же пользователя.
+    Ответы в Kafka отправляются после коммита
+
+    :param messages: список (топик, данные) в порядке получения
+    """
+    with session() as db, deferred_messages() as outgoing:
+        prefetch_user_currencies(
+            db, [message_user_id(data) for _, data in messages]
+        )
+        prefetch_transactions(db, [
+            TOPICS[topic].transaction_id(data)
+            for topic, data in messages
+            if topic in TOPICS and TOPICS[topic].transaction_id
+        ])
+
+        # Сообщения применяются в порядке получения. Пакетный обработчик
+        # получает только подряд идущие сообщения одного топика
+        for topic, run in groupby(messages, key=itemgetter(0)):
+            topic_handler = TOPICS.get(topic)
+            if topic_handler is None:
+                logger.warning(f"[Kafka Консьюмер] Неизвестный топик: {topic}")
+                continue
+
+            topic_messages = [data for _, data in run]
+            if len(topic_messages) > 1 and topic_handler.batch_handler:
+                logger.info(
+                    f"[Kafka Консьюмер] {topic_handler.description}: {len(topic_messages)} сообщений"
+                )
+                sent = len(outgoing)
+                try:
+                    with db.begin_nested():
+                        topic_handler.batch_handler(db, topic_messages)
+                    continue
+                except Exception as e:
+                    del outgoing[sent:]
+                    logger.error(
+                        f"[Kafka Консьюмер] Ошибка при пакетной обработке, повтор по одному: {e}"
+                    )
+
+            for data in topic_messages:
+                logger.info(f"[Kafka Консьюмер] {topic_handler.description}")
+                apply_message(db, outgoing, topic, data)
+
+        db.commit()
+
+
+def apply_message(db, outgoing: list, topic: str, data: dict) -> bool:
+    """
+    Применение сообщения в точке сохранения с повторами по политике
+    топика. Ошибки данных не повторяются
+
+    :param outgoing: отложенные ответы пачки, ответы откатившихся
+        попыток удаляются
+    :return: True, если сообщение применено
+    """
+    topic_handler = TOPICS[topic]
+    for attempt in range(topic_handler.retries + 1):
+        sent = len(outgoing)
         try:
-            msg = consumer.poll(1.0)
+            with db.begin_nested():
+                topic_handler.handler(db, data)
+            return True
+
+        except PERMANENT_ERRORS as e:
+            del outgoing[sent:]
+            logger.error(
+                f"[Kafka Консьюмер] Сообщение на топике '{topic}' отброшено, "
+                f"ошибка данных: {e}: {data}"
+            )
+            return False
+
         except Exception as e:
-            logger.error(f"[Kafka Консьюмер] Ошибка при получении сообщения: {e}")
-            continue
+            del outgoing[sent:]
+            logger.error(
+                f"[Kafka Консьюмер] Ошибка при обработке сообщения на топике "
+                f"'{topic}', попытка {attempt + 1}: {e}"
+            )
 
-        if msg is None:
-            continue
+    logger.error(
+        f"[Kafka Консьюмер] Сообщение на топике '{topic}' отброшено после "
+        f"{topic_handler.retries} повторов: {data}"
+    )
+    return False
 
-        value = msg.value()
-        if not value:
-            logger.warning(
-                f"[Kafka Консьюмер] Пустое сообщение на топике '{msg.value()}', пропуск"
+
+def retry_message(message: tuple[str, dict]) -> None:
+    """
+    Применение сообщения отдельной транзакцией. Если не удалась сама
+    транзакция (например, недоступна база), она повторяется с растущей
+    паузой до перехода к следующему сообщению
+    """
+    topic, data = message
+    topic_handler = TOPICS[topic]
+    for attempt in range(topic_handler.retries + 1):
+        if attempt:
+            time.sleep(topic_handler.retry_backoff * 2 ** (attempt - 1))
+            logger.info(
+                f"[Kafka Консьюмер] Повтор сообщения на топике '{topic}', попытка {attempt}"
             )
-            continue
+        try:
+            process_batch([message])
+            return
+        except Exception as e:
+            logger.error(f"[Kafka Консьюмер] Ошибка при обработке сообщения: {e}")
 
-        decoded = value.decode("utf-8")
-        if decoded.startswith("Subscribed topic not available"):
-            logger.error(f"[Kafka Консьюмер] Ошибка брокера: {decoded}")
-            continue
+    logger.error(
+        f"[Kafka Консьюмер] Сообщение на топике '{topic}' отброшено после "
+        f"{topic_handler.retries} повторов: {data}"
+    )
 
-        logger.info(
-            f"[Kafka Консьюмер] Получено сообщение на топике '{msg.topic()}': {decoded}"
+
+def apply_messages(messages: list[tuple[str, dict]]) -> None:
+    """
+    Применение пачки, а если она не закоммитилась целиком - по одному
+    сообщению в порядке получения, чтобы одно сообщение не блокировало
+    остальные
+    """
+    try:
+        process_batch(messages)
+        return
+
+    except Exception as e:
+        logger.error(
+            f"[Kafka Консьюмер] Ошибка при обработке пачки из "
+            f"{len(messages)} сообщений, повтор по одному: {e}"
         )
-        try:
-            data = json.loads(decoded)
-        except json.JSONDecodeError as e:
-            logger.error(
-                f"[Kafka Консьюмер] Ошибка парсинга JSON: {e}: {decoded}")
-            continue
 
+    for message in messages:
+        retry_message(message)
+
+
+def commit_offsets(consumer, offsets: OffsetTracker) -> None:
+    committable = offsets.committable()
+    if not committable:
+        return
+
+    try:
+        consumer.commit(offsets=committable, asynchronous=True)
+    except Exception as e:
+        logger.error(f"[Kafka Консьюмер] Ошибка коммита смещений: {e}")
+
+
+def start_consumer_loop() -> None:
+    consumer = create_consumer({
+        "bootstrap.servers": KAFKA_ADDRESS,
+        "group.id": "auth-service-group",
+        "auto.offset.reset": "earliest",
+        # Смещения коммитятся только после обработки сообщений в очередях
+        "enable.auto.commit": False
+    })
+    consumer.subscribe(list(TOPICS))
+
+    offsets = OffsetTracker()
+
+    def process_lane(items: list) -> None:
         try:
-            topic = msg.topic()
-            db = session()
+            apply_messages([message for _, message in items])
+        finally:
+            for position, _ in items:
+                offsets.done(*position)
 
-            if topic == "shop.balance.reserve.request.auth":
-                logger.info(
-                    "[Kafka Консьюмер] Обработка запроса на резервирование баланса от shop"
-                )
-                handle_balance_reserve(db, data)
-            elif topic == "shop.balance.compensate.request.auth":
-                logger.info(
-                    "[Kafka Консьюмер] Обработка запроса на компенсацию баланса от shop"
-                )
-                handle_balance_compensate(db, data)
-            elif topic == "initiator_guild_wants_declare_war":
-                logger.info(
-                    "[Kafka Консьюмер] Обработка запроса разрещение объявления войны гильдий от guilds"
-                )
-                handle_guild_war_declare(db, data)
-            elif topic == "guild_war_canceled_declined_expired":
+    # Сообщения одного пользователя идут в одну очередь своей группы и
+    # применяются по порядку, разные пользователи и группы - параллельно
+    lanes = {
+        name: MessageLanes(group.workers, group.queue_size, group.batch_size, process_lane)
+        for name, group in WORKER_GROUPS.items()
+    }
+    for group_lanes in lanes.values():
+        group_lanes.start()
+
+    # Сообщения, не поместившиеся в заполненные очереди группы. Пока они
+    # есть, партиции топиков группы стоят на паузе, остальные читаются
+    overflow = {name: deque() for name in lanes}
+    paused = {}
+
+    logger.info(
+        f"[Kafka Консьюмер] Запущен обработчик транзакций, группы: {list(WORKER_GROUPS.values())}"
+    )
+    while True:
+        for name, group_lanes in lanes.items():
+            pending = overflow[name]
+            while pending and group_lanes.submit(
+                message_user_id(pending[0][1][1]), pending[0], 0
+            ):
+                pending.popleft()
+
+            if name in paused and not pending and group_lanes.has_capacity():
+                consumer.resume(paused.pop(name))
                 logger.info(
-                    "[Kafka Консьюмер] Обработка запроса на компенсацию баланса от guilds"
+                    f"[Kafka Консьюмер] Очереди группы {name} разгружены, чтение возобновлено"
                 )
-                handle_guild_war_compensate(db, data)
-            else:
-                logger.warning(f"[Kafka Консьюмер] Неизвестный топик: {topic}")
+
+        try:
+            raw_messages = consumer.consume(
+                KAFKA_CONSUME_BATCH_SIZE,
+                # Пока есть непоставленные сообщения, очереди проверяются чаще
+                0.05 if any(overflow.values()) else KAFKA_CONSUME_TIMEOUT
+            )
         except Exception as e:
-            logger.error(f"[Kafka Консьюмер] Ошибка при обработке сообщения: {e}")
+            logger.error(f"[Kafka Консьюмер] Ошибка при получении сообщения: {e}")
+            continue
+
+        for msg in raw_messages:
+            decoded = decode_message(msg)
+            position = (msg.topic(), msg.partition(), msg.offset())
+            if decoded is None:
+                if not msg.error():
+                    # Пропущенное сообщение не должно задерживать коммит партиции
+                    offsets.track(*position)
+                    offsets.done(*position)
+                continue
+
+            offsets.track(*position)
+            topic, data = decoded
+            group = TOPICS[topic].group
+            item = (position, decoded)
+            if overflow[group] or not lanes[group].submit(message_user_id(data), item, 0):
+                overflow[group].append(item)
+                if group not in paused:
+                    paused[group] = [
+                        partition for partition in consumer.assignment()
+                        if partition.topic in TOPICS and TOPICS[partition.topic].group == group
+                    ]
+                    consumer.pause(paused[group])
+                    logger.warning(
+                        f"[Kafka Консьюмер] Очереди группы {group} заполнены, чтение ее топиков приостановлено"
+                    )
+
+        commit_offsets(consumer, offsets)
@@ -1,49 +1,82 @@
+from collections import defaultdict
+
 from config import logger
 from sqlalchemy.orm import Session
 from kafka.services import (
-    user_exists, get_user_currency, get_user_transaction, process_compensation
+    user_exists, get_transaction_statuses, complete_reservations,
+    refund_balances
 )
-from database.models import CurrencyType
+
+
+COMPENSATED_STATUSES = {"declined", "canceled", "expired"}
 
 
 def handle_guild_war_compensate(db: Session, msg: dict[str, str | int]) -> None:
+    handle_guild_war_compensate_batch(db, [msg])
+
+
+def handle_guild_war_compensate_batch(
+    db: Session, messages: list[dict[str, str | int]]
+) -> None:
+    """
+    Компенсация пачки отмененных войн: зарезервированные транзакции
+    находятся и переводятся в COMPLETED одним запросом, возвраты
+    начисляются одним UPDATE на валюту
+    """
     logger.info(
-        f"[Обработчик] Обработка сообщения на топике: guild_war_canceled_declined_expired с данными: {msg}"
+        f"[Обработчик] Обработка {len(messages)} сообщений на топике: "
+        f"guild_war_canceled_declined_expired"
     )
-    status = msg["status"]
+    transactions: dict[str, int] = {}
+    for msg in messages:
+        status = msg["status"]
+        if status not in COMPENSATED_STATUSES:
+            logger.info(f"[Обработчик] Статус '{status}' не требует компенсации")
+            continue
+
+        user_id = msg["initiator_owner_id"]
+        transaction_id = f"guild:{msg['correlation_id']}"
+        if not user_exists(db, user_id):
+            logger.warning(
+                f"[Обработчик] Пользователь {user_id} не существует, транзакция {transaction_id} пропускается"
+            )
+            continue
+        transactions[transaction_id] = user_id
 
-    if status not in {"declined", "canceled", "expired"}:
-        logger.info(f"[Обработчик] Статус '{status}' не требует компенсации")
+    if not transactions:
         return None
 
-    user_id = msg["initiator_owner_id"]
-    correlation_id = msg["correlation_id"]
-    transaction_id = f"guild:{correlation_id}"
-    amount = 10
-    currency = CurrencyType.GUILD_RAGE
+    completed = complete_reservations(db, transactions)
 
-    if not user_exists(db, user_id):
-        logger.warning(
-            f"[Обработчик] Пользователь {user_id} не существует, транзакция пропускается"
-        )
-        return None
+    refunds: dict = defaultdict(lambda: defaultdict(int))
+    for row in completed:
+        refunds[row.currency_type][row.user_id] += row.amount
 
-    transaction = get_user_transaction(db, transaction_id, user_id)
-    if not transaction:
-        logger.warning(
-            f"[Обработчик] Транзакция {transaction_id} не найдена для пользователя {user_id}"
-        )
-        return None
+    balances = {
+        currency: refund_balances(db, currency, amounts)
+        for currency, amounts in refunds.items()
+    }
+    db.flush()
 
-    user_currency = get_user_currency(db, user_id)
-    if not user_currency:
-        logger.warning("[Обработчик] Такой валюты у пользователя нет")
-        return None
+    for row in completed:
+        logger.info(
+            f"[Обработчик] Компенсация {row.transaction_id} завершена: добавлено "
+            f"{row.amount} {row.currency_type.value} пользователю {row.user_id}, "
+            f"баланс: {balances[row.currency_type].get(row.user_id)}"
+        )
 
-    logger.info(
-        f"[Обработчик] Выполнение компенсации: добавление {amount} {currency.value} пользователю {user_id}"
-    )
-    process_compensation(db, user_currency, currency, amount, transaction)
-    logger.info(
-        f"[Обработчик] Компенсация завершена, статус транзакции обновлен на {transaction.status}"
-    )
+    skipped = transactions.keys() - {row.transaction_id for row in completed}
+    if skipped:
+        statuses = get_transaction_statuses(db, skipped)
+        for transaction_id in skipped:
+            status = statuses.get(transaction_id)
+            if status is None:
+                logger.warning(
+                    f"[Обработчик] Транзакция {transaction_id} не найдена для "
+                    f"пользователя {transactions[transaction_id]}"
+                )
+            else:
+                logger.info(
+                    f"[Обработчик] Транзакция {transaction_id} в статусе {status}, "
+                    f"компенсация не требуется"
+                )
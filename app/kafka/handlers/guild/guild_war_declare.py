@@ -1,10 +1,8 @@
 from config import logger
 from sqlalchemy.orm import Session
+from kafka.idempotency import processed_operations
 from kafka.producer import send_message_to_kafka
-from kafka.services import (
-    user_exists, get_user_currency, create_user_transaction_object,
-    save_transaction
-)
+from kafka.services import user_exists, get_user_currency, reserve_balance
 from database.models import CurrencyType, TransactionStatus
 
 
@@ -18,6 +16,28 @@ def handle_guild_war_declare(db: Session, msg: dict[str, str | int]) -> None:
     transaction_id = f"guild:{correlation_id}"
     amount = 10
 
+    responses = processed_operations.lookup(
+        db, transaction_id,
+        rebuild=lambda transaction: [(
+            "auth.guild_war.declare.response.guild",
+            {
+                "initiator_guild_id": initiator_guild_id,
+                "initiator_owner_id": user_id,
+                "correlation_id": correlation_id,
+                "success": transaction.status != TransactionStatus.DECLINED,
+            },
+            "guilds"
+        )]
+    )
+    if responses is not None:
+        logger.info(
+            f"[Обработчик] Транзакция {transaction_id} уже обработана, "
+            f"повторная отправка исходного ответа"
+        )
+        for topic, payload, target_service in responses:
+            send_message_to_kafka(topic, payload, target_service)
+        return None
+
     if not user_exists(db, user_id):
         logger.warning(
             f"[Обработчик] Пользователь {user_id} не существует, транзакция пропускается"
@@ -34,43 +54,30 @@ def handle_guild_war_declare(db: Session, msg: dict[str, str | int]) -> None:
         )
         return None
 
-    user_currency = get_user_currency(db, user_id)
     logger.info(
-        f"[Обработчик] Получена информация о валюте пользователя {user_id}: {user_currency}"
+        f"[Обработчик] Резервирование {amount} guild_rage для пользователя {user_id}"
     )
-    transaction = create_user_transaction_object(
-        transaction_id, user_id,  CurrencyType.GUILD_RAGE,
-        amount,  TransactionStatus.PENDING
+    transaction, balance = reserve_balance(
+        db, transaction_id, user_id, CurrencyType.GUILD_RAGE, amount
     )
-    logger.info(f"[Обработчик] Создан объект транзакции: {transaction}")
 
-    if not user_currency:
-        transaction.status = TransactionStatus.DECLINED
+    if transaction.status == TransactionStatus.RESERVED:
+        logger.info(
+            f"[Обработчик] Успешно зарезервировано {amount} guild_rage "
+            f"для пользователя {user_id}, остаток: {balance}"
+        )
+    elif get_user_currency(db, user_id) is None:
         logger.warning(
             f"[Обработчик] Такой валюты у пользователя нет, транзакция отклонена"
         )
     else:
-        available_amount = user_currency.guild_rage
-        logger.info(
-            f"[Обработчик] Доступный баланс по guild_rage: {available_amount}"
+        logger.warning(
+            f"[Обработчик] Недостаточно средств: требуется {amount} guild_rage"
         )
-        if available_amount >= amount:
-            user_currency.guild_rage -= amount
-            transaction.status = TransactionStatus.RESERVED
-            logger.info(
-                f"[Обработчик] Успешно зарезервировано {amount} guild_rage для пользователя {user_id}"
-            )
-        else:
-            transaction.status = TransactionStatus.DECLINED
-            logger.warning(
-                f"[Обработчик] Недостаточно средств: требуется {amount}, доступно {available_amount}"
-            )
 
     logger.info(
-        f"[Обработчик] Сохранение транзакции в базу данных со статусом {transaction.status}"
+        f"[Обработчик] Транзакция {transaction_id} сохранена со статусом {transaction.status}"
     )
-    save_transaction(db, transaction)
-    logger.info(f"[Обработчик] Транзакция {transaction_id} успешно сохранена")
     logger.info("[Обработчик] Отправка ответа в Kafka...")
     send_message_to_kafka(
         topic="auth.guild_war.declare.response.guild",
@@ -80,5 +87,6 @@ def handle_guild_war_declare(db: Session, msg: dict[str, str | int]) -> None:
             "correlation_id": correlation_id,
             "success": transaction.status == TransactionStatus.RESERVED,
         },
-        target_service="guilds"
+        target_service="guilds",
+        on_sent=processed_operations.remember(transaction_id)
     )
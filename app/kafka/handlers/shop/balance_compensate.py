@@ -6,7 +6,8 @@ from database.models import (
 from config import logger
 from kafka.producer import send_message_to_kafka
 from kafka.services import (
-    user_exists, get_user_transaction, get_user_currency, process_compensation
+    user_exists, find_transaction, get_user_transaction, complete_reservations,
+    refund_balances
 )
 
 
@@ -18,7 +19,10 @@ def handle_balance_compensate(db: Session, msg: dict[str, str | int]) -> None:
     prefixed_transaction_id = f"shop:{transaction_id}"
     user_id = msg["user_id"]
     amount = msg["cost"]
-    currency = CurrencyType(msg["currency_type"].lower())
+    try:
+        currency = CurrencyType(msg["currency_type"].lower())
+    except ValueError:
+        currency = None
     error_message = "null"
 
     if amount <= 0:
@@ -53,10 +57,17 @@ def handle_balance_compensate(db: Session, msg: dict[str, str | int]) -> None:
         )
         return None
 
-    transaction = get_user_transaction(db, prefixed_transaction_id, user_id)
-    if not transaction:
+    # Валюта компенсации должна совпадать с валютой резервирования,
+    # возврат начисляется в валюте сохраненной транзакции
+    reserved = find_transaction(db, prefixed_transaction_id)
+    if currency is None or (
+        reserved is not None and
+        reserved.user_id == int(user_id) and
+        reserved.currency_type != currency
+    ):
         logger.warning(
-            f"[Обработчик] Транзакция {prefixed_transaction_id} не найдена для пользователя {user_id}"
+            f"[Обработчик] Валюта {msg['currency_type']} не совпадает с валютой "
+            f"транзакции {prefixed_transaction_id}"
         )
         send_message_to_kafka(
             topic="auth.balance.compensate.response.shop",
@@ -64,44 +75,64 @@ def handle_balance_compensate(db: Session, msg: dict[str, str | int]) -> None:
                 "transaction_id": transaction_id,
                 "user_id": user_id,
                 "success": False,
-                "error_message": "transaction_not_found"
+                "error_message": "invalid_currency"
             },
             target_service="shop"
         )
         return None
 
-    logger.info(
-        f"[Обработчик] Найдена транзакция {prefixed_transaction_id} со статусом {transaction.status}"
-    )
-    user_currency = get_user_currency(db, user_id)
-    if not user_currency:
-        logger.warning("[Обработчик] Такой валюты у пользователя нет")
+    # Возврат выполняется, только пока средства не возвращены (RESERVED или
+    # EXPIRED): повторная компенсация и возврат по сроку не повторяются
+    completed = complete_reservations(db, {prefixed_transaction_id: user_id})
+    if not completed:
+        transaction = get_user_transaction(db, prefixed_transaction_id, user_id)
+        if not transaction:
+            logger.warning(
+                f"[Обработчик] Транзакция {prefixed_transaction_id} не найдена для пользователя {user_id}"
+            )
+            error_message = "transaction_not_found"
+        elif transaction.status in (TransactionStatus.COMPLETED, TransactionStatus.FAILED):
+            logger.info(
+                f"[Обработчик] Транзакция {prefixed_transaction_id} уже в статусе "
+                f"{transaction.status}, компенсация не требуется"
+            )
+        else:
+            logger.warning(
+                f"[Обработчик] Транзакция {prefixed_transaction_id} в статусе "
+                f"{transaction.status} не может быть компенсирована"
+            )
+            error_message = "transaction_not_reserved"
+
         send_message_to_kafka(
             topic="auth.balance.compensate.response.shop",
             payload={
                 "transaction_id": transaction_id,
                 "user_id": user_id,
-                "success": False,
-                "error_message": "invalid_currency"
+                "success": error_message == "null",
+                "error_message": error_message
             },
             target_service="shop"
         )
         return None
 
+    transaction = completed[0]
     logger.info(
-        f"[Обработчик] Выполнение компенсации: добавление {amount} {currency.value} пользователю {user_id}"
+        f"[Обработчик] Выполнение компенсации: добавление {transaction.amount} "
+        f"{transaction.currency_type.value} пользователю {user_id}"
+    )
+    balances = refund_balances(
+        db, transaction.currency_type, {transaction.user_id: transaction.amount}
     )
-    process_compensation(db, user_currency, currency, amount, transaction)
     logger.info(
-        f"[Обработчик] Компенсация завершена, статус транзакции обновлен на {transaction.status}"
+        f"[Обработчик] Компенсация завершена, статус транзакции обновлен на {TransactionStatus.COMPLETED}"
     )
 
-    if currency == CurrencyType.GOLD:
+    if transaction.currency_type == CurrencyType.GOLD:
         logger.info("[Обработчик] Отправка события изменения GOLD")
         send_message_to_kafka(
             topic="prod.auth.fact.currency-change.1",
             payload={
-                "user_id": user_id, "gold": getattr(user_currency, "gold")
+                "user_id": user_id, "gold": balances.get(transaction.user_id)
             },
             target_service="scoreboard"
         )
@@ -3,11 +3,19 @@ from sqlalchemy.orm import Session
 from database.models import (
     UserBase, UserCurrency, UserTransaction, CurrencyType, TransactionStatus
 )
+from kafka.idempotency import processed_operations
 from kafka.producer import send_message_to_kafka
-from kafka.services import (
-    user_exists, get_user_currency, create_user_transaction_object,
-    save_transaction
-)
+from kafka.services import user_exists, get_user_currency, reserve_balance
+
+
+def _decline_reason(db: Session, user_id: int) -> str:
+    """
+    Причина отказа в резервировании, одна и та же для исходного ответа
+    и для ответа, восстановленного по сохраненной транзакции
+    """
+    if get_user_currency(db, user_id) is None:
+        return "invalid_currency"
+    return "insufficient_funds"
 
 
 def handle_balance_reserve(db: Session, msg: dict[str, str | int]) -> None:
@@ -35,6 +43,32 @@ def handle_balance_reserve(db: Session, msg: dict[str, str | int]) -> None:
         )
         return None
 
+    responses = processed_operations.lookup(
+        db, prefixed_transaction_id,
+        rebuild=lambda transaction: [(
+            "auth.balance.reserve.response.shop",
+            {
+                "transaction_id": transaction_id,
+                "user_id": user_id,
+                "success": transaction.status != TransactionStatus.DECLINED,
+                "error_message": (
+                    _decline_reason(db, user_id)
+                    if transaction.status == TransactionStatus.DECLINED
+                    else "null"
+                )
+            },
+            "shop"
+        )]
+    )
+    if responses is not None:
+        logger.info(
+            f"[Обработчик] Транзакция {prefixed_transaction_id} уже обработана, "
+            f"повторная отправка исходного ответа"
+        )
+        for topic, payload, target_service in responses:
+            send_message_to_kafka(topic, payload, target_service)
+        return None
+
     if not user_exists(db, user_id):
         logger.warning(
             f"[Обработчик] Пользователь {user_id} не существует, транзакция пропускается"
@@ -51,45 +85,32 @@ def handle_balance_reserve(db: Session, msg: dict[str, str | int]) -> None:
         )
         return None
 
-    user_currency = get_user_currency(db, user_id)
     logger.info(
-        f"[Обработчик] Получена информация о валюте пользователя {user_id}: {user_currency}"
+        f"[Обработчик] Резервирование {amount} {currency.value} для пользователя {user_id}"
     )
-    transaction = create_user_transaction_object(
-        prefixed_transaction_id, user_id, currency,
-        amount, TransactionStatus.PENDING
+    transaction, balance = reserve_balance(
+        db, prefixed_transaction_id, user_id, currency, amount
     )
-    logger.info(f"[Обработчик] Создан объект транзакции: {transaction}")
 
-    if not user_currency:
-        transaction.status = TransactionStatus.DECLINED
-        error_message = "invalid_currency"
-        logger.warning(
-            f"[Обработчик] Такой валюты у пользователя нет, транзакция отклонена"
-        )
-    else:
-        available_amount = getattr(user_currency, currency.value)
+    if transaction.status == TransactionStatus.RESERVED:
         logger.info(
-            f"[Обработчик] Доступный баланс по {currency.value}: {available_amount}"
+            f"[Обработчик] Успешно зарезервировано {amount} {currency.value} "
+            f"для пользователя {user_id}, остаток: {balance}"
         )
-        if available_amount >= amount:
-            setattr(user_currency, currency.value, available_amount - amount)
-            transaction.status = TransactionStatus.RESERVED
-            logger.info(
-                f"[Обработчик] Успешно зарезервировано {amount} {currency.value} для пользователя {user_id}"
+    else:
+        error_message = _decline_reason(db, user_id)
+        if error_message == "invalid_currency":
+            logger.warning(
+                f"[Обработчик] Такой валюты у пользователя нет, транзакция отклонена"
             )
         else:
-            transaction.status = TransactionStatus.DECLINED
-            error_message = "insufficient_funds"
             logger.warning(
-                f"[Обработчик] Недостаточно средств: требуется {amount}, доступно {available_amount}"
+                f"[Обработчик] Недостаточно средств: требуется {amount} {currency.value}"
             )
 
     logger.info(
-        f"[Обработчик] Сохранение транзакции в базу данных со статусом {transaction.status}"
+        f"[Обработчик] Транзакция {prefixed_transaction_id} сохранена со статусом {transaction.status}"
     )
-    save_transaction(db, transaction)
-    logger.info(f"[Обработчик] Транзакция {prefixed_transaction_id} успешно сохранена")
 
     if (
         currency == CurrencyType.GOLD and
@@ -100,9 +121,7 @@ def handle_balance_reserve(db: Session, msg: dict[str, str | int]) -> None:
         )
         send_message_to_kafka(
             topic="prod.auth.fact.currency-change.1",
-            payload={
-                "user_id": user_id, "gold": getattr(user_currency, "gold")
-            },
+            payload={"user_id": user_id, "gold": balance},
             target_service="scoreboard"
         )
 
@@ -115,5 +134,6 @@ def handle_balance_reserve(db: Session, msg: dict[str, str | int]) -> None:
             "success": transaction.status == TransactionStatus.RESERVED,
             "error_message": error_message
         },
-        target_service="shop"
+        target_service="shop",
+        on_sent=processed_operations.remember(prefixed_transaction_id)
     )
@@ -0,0 +1,106 @@
+import json
+from typing import Callable
+
+from redis import Redis, RedisError
+from sqlalchemy.orm import Session
+
+from cache import TTLCache, MISS
+from config import (
+    logger,
+    KAFKA_IDEMPOTENCY_CACHE_SIZE,
+    KAFKA_IDEMPOTENCY_TTL
+)
+from database.models import UserTransaction
+from extensions import idempotency_redis
+from kafka.services import find_transaction
+from metrics import Counter
+
+
+Response = tuple[str, dict, str]
+
+duplicates_total = Counter(
+    "kafka_duplicate_operations_total",
+    "Повторно доставленные операции, на которые отправлен исходный ответ"
+)
+
+
+class ProcessedOperations:
+    """
+    Ответы на уже обработанные операции с балансом по идентификатору
+    транзакции с префиксом. Повторная доставка сообщения находится
+    в LRU процесса, затем по уникальному индексу транзакций, и получает
+    исходный ответ без повторного применения операции
+    """
+
+    def __init__(self, redis: Redis, max_size: int, ttl: int) -> None:
+        self.redis = redis
+        self.ttl = ttl
+        self._cache = TTLCache(max_size)
+
+    @staticmethod
+    def _key(transaction_id: str) -> str:
+        return f"processed:{transaction_id}"
+
+    def lookup(
+        self,
+        session_db: Session,
+        transaction_id: str,
+        rebuild: Callable[[UserTransaction], list[Response]]
+    ) -> list[Response] | None:
+        """
+        Поиск ответа на уже обработанную операцию
+
+        :param session_db: сессия БД обработки пачки
+        :param transaction_id: идентификатор транзакции с префиксом
+        :param rebuild: построение ответа по сохраненной транзакции,
+            если исходный ответ уже вытеснен из Redis
+        :return: список (topic, payload, target_service) или None для новой операции
+        """
+        responses = self._cache.get(transaction_id)
+        if responses is not MISS:
+            duplicates_total.inc()
+            return responses
+
+        transaction = find_transaction(session_db, transaction_id)
+        if transaction is None:
+            return None
+
+        try:
+            stored = self.redis.get(self._key(transaction_id))
+        except RedisError as e:
+            logger.error(f"[Идемпотентность] Ошибка чтения ответа из Redis: {e}")
+            stored = None
+
+        if stored:
+            responses = [tuple(response) for response in json.loads(stored)]
+        else:
+            responses = rebuild(transaction)
+
+        self._cache.set(transaction_id, responses, self.ttl)
+        duplicates_total.inc()
+        return responses
+
+    def remember(self, transaction_id: str) -> Callable[[str, dict, str], None]:
+        """
+        Callback для send_message_to_kafka, сохраняющий отправленный ответ.
+        При отложенной отправке вызывается только после коммита транзакции
+
+        :param transaction_id: идентификатор транзакции с префиксом
+        """
+        def on_sent(topic: str, payload: dict, target_service: str) -> None:
+            responses = [(topic, payload, target_service)]
+            self._cache.set(transaction_id, responses, self.ttl)
+            try:
+                self.redis.set(
+                    self._key(transaction_id), json.dumps(responses), ex=self.ttl
+                )
+            except RedisError as e:
+                logger.error(
+                    f"[Идемпотентность] Ошибка сохранения ответа в Redis: {e}"
+                )
+        return on_sent
+
+
+processed_operations = ProcessedOperations(
+    idempotency_redis, KAFKA_IDEMPOTENCY_CACHE_SIZE, KAFKA_IDEMPOTENCY_TTL
+)
@@ -0,0 +1,115 @@
+import zlib
+from collections import defaultdict
+from queue import Queue, Empty, Full
+from threading import Lock, Thread
+from typing import Callable
+
+from confluent_kafka import TopicPartition
+
+from config import logger
+
+
+class MessageLanes:
+    """
+    Пул упорядоченных очередей с потоком-обработчиком на каждую.
+    Сообщения с одним ключом всегда попадают в одну очередь и
+    обрабатываются последовательно, разные ключи - параллельно
+    """
+
+    def __init__(
+        self,
+        count: int,
+        queue_size: int,
+        batch_size: int,
+        process: Callable[[list], None]
+    ) -> None:
+        self.batch_size = batch_size
+        self.process = process
+        self.queues: list[Queue] = [
+            Queue(maxsize=queue_size) for _ in range(max(count, 1))
+        ]
+        self._threads: list[Thread] = []
+
+    def start(self) -> None:
+        for number, lane in enumerate(self.queues):
+            thread = Thread(
+                target=self._run, args=(lane,),
+                name=f"kafka-lane-{number}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def lane_for(self, key) -> Queue:
+        # crc32, а не hash(): распределение не зависит от PYTHONHASHSEED
+        return self.queues[zlib.crc32(str(key).encode()) % len(self.queues)]
+
+    def submit(self, key, item, timeout: float) -> bool:
+        """
+        Постановка элемента в очередь ключа
+
+        :param timeout: сколько ждать места в очереди, в секундах
+        :return: False, если очередь так и осталась заполненной
+        """
+        try:
+            self.lane_for(key).put(item, timeout=timeout)
+        except Full:
+            return False
+        return True
+
+    def has_capacity(self) -> bool:
+        """
+        Все очереди заполнены не больше чем наполовину
+        """
+        return all(lane.qsize() <= lane.maxsize // 2 for lane in self.queues)
+
+    def _run(self, lane: Queue) -> None:
+        while True:
+            items = [lane.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(lane.get_nowait())
+                except Empty:
+                    break
+
+            try:
+                self.process(items)
+            except Exception as e:
+                logger.error(f"[Kafka Консьюмер] Ошибка в потоке обработки: {e}")
+
+
+class OffsetTracker:
+    """
+    Смещения, которые можно коммитить при параллельной обработке:
+    для каждой партиции - наименьшее еще не обработанное сообщение
+    """
+
+    def __init__(self) -> None:
+        self._pending: dict[tuple[str, int], set[int]] = defaultdict(set)
+        self._next: dict[tuple[str, int], int] = {}
+        self._changed: set[tuple[str, int]] = set()
+        self._lock = Lock()
+
+    def track(self, topic: str, partition: int, offset: int) -> None:
+        with self._lock:
+            self._pending[(topic, partition)].add(offset)
+            self._next[(topic, partition)] = max(
+                self._next.get((topic, partition), 0), offset + 1
+            )
+
+    def done(self, topic: str, partition: int, offset: int) -> None:
+        with self._lock:
+            self._pending[(topic, partition)].discard(offset)
+            self._changed.add((topic, partition))
+
+    def committable(self) -> list[TopicPartition]:
+        """
+        Смещения партиций, изменившиеся с прошлого вызова
+        """
+        with self._lock:
+            offsets = []
+            for topic, partition in self._changed:
+                pending = self._pending[(topic, partition)]
+                offset = min(pending) if pending else self._next[(topic, partition)]
+                offsets.append(TopicPartition(topic, partition, offset))
+            self._changed.clear()
+            return offsets
@@ -0,0 +1,333 @@
+import time
+import zlib
+from collections import defaultdict
+from threading import Condition, Lock
+
+from confluent_kafka import TopicPartition
+
+
+class MemoryMessage:
+    """
+    Сообщение in-memory брокера с интерфейсом confluent_kafka.Message
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        partition: int,
+        offset: int,
+        key: bytes | None,
+        value: bytes | None,
+        timestamp: float
+    ) -> None:
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._timestamp = timestamp
+
+    def topic(self) -> str:
+        return self._topic
+
+    def partition(self) -> int:
+        return self._partition
+
+    def offset(self) -> int:
+        return self._offset
+
+    def key(self) -> bytes | None:
+        return self._key
+
+    def value(self) -> bytes | None:
+        return self._value
+
+    def timestamp(self) -> tuple[int, int]:
+        # Тип 1 - время создания сообщения, в миллисекундах как в Kafka
+        return 1, int(self._timestamp * 1000)
+
+    def error(self) -> None:
+        return None
+
+    def __repr__(self):
+        return f"<MemoryMessage {self._topic}[{self._partition}]@{self._offset}>"
+
+
+class MemoryBroker:
+    """
+    Брокер в памяти процесса: топики с партициями, смещения и группы
+    консьюмеров. Нужен для нагрузочных замеров консьюмера и обработчиков
+    без кластера Kafka
+    """
+
+    def __init__(self, partitions: int = 3) -> None:
+        self.default_partitions = partitions
+        self._topics: dict[str, list[list[MemoryMessage]]] = {}
+        # Закоммиченные смещения: (группа, топик, партиция) -> смещение
+        self._committed: dict[tuple[str, str, int], int] = {}
+        self._members: dict[str, list["MemoryConsumer"]] = defaultdict(list)
+        self._round_robin: dict[str, int] = defaultdict(int)
+        self._lock = Lock()
+        self._new_messages = Condition(self._lock)
+
+    def create_topic(self, topic: str, partitions: int | None = None) -> None:
+        with self._lock:
+            self._ensure_topic(topic, partitions)
+
+    def _ensure_topic(
+        self,
+        topic: str,
+        partitions: int | None = None
+    ) -> list[list[MemoryMessage]]:
+        if topic not in self._topics:
+            self._topics[topic] = [
+                [] for _ in range(partitions or self.default_partitions)
+            ]
+            for group_id, members in self._members.items():
+                if any(topic in member.topics for member in members):
+                    self._rebalance(group_id)
+        return self._topics[topic]
+
+    def append(self, topic: str, value: bytes | None, key: bytes | None) -> MemoryMessage:
+        """
+        Запись сообщения. Партиция выбирается по ключу, без ключа - по кругу
+        """
+        with self._lock:
+            partitions = self._ensure_topic(topic)
+            if key is not None:
+                partition = zlib.crc32(key) % len(partitions)
+            else:
+                partition = self._round_robin[topic] % len(partitions)
+                self._round_robin[topic] += 1
+
+            log = partitions[partition]
+            message = MemoryMessage(
+                topic, partition, len(log), key, value, time.time()
+            )
+            log.append(message)
+            self._new_messages.notify_all()
+            return message
+
+    def join(self, consumer: "MemoryConsumer") -> None:
+        with self._lock:
+            for topic in consumer.topics:
+                self._ensure_topic(topic)
+            if consumer not in self._members[consumer.group_id]:
+                self._members[consumer.group_id].append(consumer)
+            self._rebalance(consumer.group_id)
+
+    def leave(self, consumer: "MemoryConsumer") -> None:
+        with self._lock:
+            members = self._members[consumer.group_id]
+            if consumer in members:
+                members.remove(consumer)
+            self._rebalance(consumer.group_id)
+
+    def _rebalance(self, group_id: str) -> None:
+        # Партиции каждого топика делятся между участниками группы по кругу
+        members = self._members[group_id]
+        for member in members:
+            member._assignment = []
+
+        for topic in sorted(self._topics):
+            subscribed = [member for member in members if topic in member.topics]
+            for partition in range(len(self._topics[topic])):
+                if subscribed:
+                    owner = subscribed[partition % len(subscribed)]
+                    owner._assignment.append((topic, partition))
+
+        # Участник, сохранивший партицию, продолжает с текущей позиции,
+        # иначе прочитанные, но не закоммиченные сообщения пришли бы снова
+        for member in members:
+            member.positions = {
+                tp: member.positions[tp] if tp in member.positions
+                else self._start_offset(group_id, *tp, member.offset_reset)
+                for tp in member._assignment
+            }
+
+    def _start_offset(
+        self,
+        group_id: str,
+        topic: str,
+        partition: int,
+        offset_reset: str
+    ) -> int:
+        committed = self._committed.get((group_id, topic, partition))
+        if committed is not None:
+            return committed
+        if offset_reset == "earliest":
+            return 0
+        return len(self._topics[topic][partition])
+
+    def fetch(
+        self,
+        consumer: "MemoryConsumer",
+        max_messages: int,
+        timeout: float
+    ) -> list[MemoryMessage]:
+        """
+        Чтение до max_messages сообщений из назначенных консьюмеру партиций.
+        Ждет новых сообщений не дольше timeout секунд
+        """
+        deadline = time.monotonic() + max(timeout, 0)
+        with self._lock:
+            while True:
+                messages = self._read(consumer, max_messages)
+                remaining = deadline - time.monotonic()
+                if messages or remaining <= 0:
+                    return messages
+                self._new_messages.wait(remaining)
+
+    def _read(
+        self,
+        consumer: "MemoryConsumer",
+        max_messages: int
+    ) -> list[MemoryMessage]:
+        messages = []
+        assignment = [
+            tp for tp in consumer._assignment if tp not in consumer.paused
+        ]
+        # Партиции читаются по очереди, чтобы одна не забирала всю пачку
+        while len(messages) < max_messages:
+            progressed = False
+            for topic, partition in assignment:
+                log = self._topics[topic][partition]
+                position = consumer.positions[(topic, partition)]
+                if position < len(log):
+                    messages.append(log[position])
+                    consumer.positions[(topic, partition)] = position + 1
+                    progressed = True
+                    if len(messages) >= max_messages:
+                        break
+            if not progressed:
+                break
+
+        return messages
+
+    def commit(self, consumer: "MemoryConsumer", offsets=None) -> None:
+        with self._lock:
+            if offsets is None:
+                positions = consumer.positions.items()
+            else:
+                positions = [((tp.topic, tp.partition), tp.offset) for tp in offsets]
+
+            for (topic, partition), position in positions:
+                self._committed[(consumer.group_id, topic, partition)] = position
+
+    def lag(self, group_id: str) -> int:
+        """
+        Количество непрочитанных группой сообщений во всех топиках
+        """
+        with self._lock:
+            return sum(
+                len(log) - self._committed.get((group_id, topic, partition), 0)
+                for topic, partitions in self._topics.items()
+                for partition, log in enumerate(partitions)
+                if any(topic in member.topics for member in self._members[group_id])
+            )
+
+
+broker = MemoryBroker()
+
+
+class MemoryProducer:
+    """
+    Продюсер in-memory брокера с интерфейсом confluent_kafka.Producer
+    """
+
+    def __init__(self, config: dict, broker_instance: MemoryBroker | None = None) -> None:
+        self.config = config
+        self.broker = broker_instance or broker
+        self._callbacks: list = []
+        self._callbacks_lock = Lock()
+
+    def produce(
+        self,
+        topic: str,
+        value: bytes | None = None,
+        key: bytes | str | None = None,
+        on_delivery=None,
+        callback=None
+    ) -> None:
+        if isinstance(key, str):
+            key = key.encode("utf-8")
+
+        message = self.broker.append(topic, value, key)
+        on_delivery = on_delivery or callback
+        if on_delivery is not None:
+            with self._callbacks_lock:
+                self._callbacks.append((on_delivery, message))
+
+    def poll(self, timeout: float | None = None) -> int:
+        # Как в librdkafka, delivery callbacks вызываются из poll/flush
+        with self._callbacks_lock:
+            callbacks, self._callbacks = self._callbacks, []
+
+        for on_delivery, message in callbacks:
+            on_delivery(None, message)
+
+        if not callbacks and timeout:
+            time.sleep(min(timeout, 0.01))
+        return len(callbacks)
+
+    def flush(self, timeout: float | None = None) -> int:
+        self.poll(0)
+        return 0
+
+    def __len__(self) -> int:
+        return len(self._callbacks)
+
+
+class MemoryConsumer:
+    """
+    Консьюмер in-memory брокера с интерфейсом confluent_kafka.Consumer.
+    Смещения коммитятся автоматически при каждом чтении
+    """
+
+    def __init__(self, config: dict, broker_instance: MemoryBroker | None = None) -> None:
+        self.config = config
+        self.broker = broker_instance or broker
+        self.group_id = config.get("group.id", "default")
+        self.offset_reset = config.get("auto.offset.reset", "latest")
+        self.auto_commit = config.get("enable.auto.commit", True)
+        self.topics: list[str] = []
+        self._assignment: list[tuple[str, int]] = []
+        self.positions: dict[tuple[str, int], int] = {}
+        self.paused: set[tuple[str, int]] = set()
+
+    def subscribe(self, topics: list[str]) -> None:
+        self.topics = list(topics)
+        self.broker.join(self)
+
+    def poll(self, timeout: float | None = None) -> MemoryMessage | None:
+        messages = self.consume(1, timeout if timeout is not None else -1)
+        return messages[0] if messages else None
+
+    def consume(
+        self,
+        num_messages: int = 1,
+        timeout: float = -1
+    ) -> list[MemoryMessage]:
+        messages = self.broker.fetch(
+            self, num_messages, timeout if timeout >= 0 else 3600
+        )
+        if messages and self.auto_commit:
+            self.broker.commit(self)
+        return messages
+
+    def commit(
+        self, message=None, offsets=None, asynchronous: bool = True
+    ) -> None:
+        self.broker.commit(self, offsets)
+
+    def assignment(self) -> list[TopicPartition]:
+        return [TopicPartition(topic, partition) for topic, partition in self._assignment]
+
+    def pause(self, partitions) -> None:
+        self.paused.update((tp.topic, tp.partition) for tp in partitions)
+
+    def resume(self, partitions) -> None:
+        self.paused.difference_update((tp.topic, tp.partition) for tp in partitions)
+
+    def close(self) -> None:
+        self.broker.leave(self)
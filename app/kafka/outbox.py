@@ -0,0 +1,269 @@
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+
+from config import (
+    logger,
+    OUTBOX_BATCH_SIZE,
+    OUTBOX_POLL_INTERVAL,
+    OUTBOX_RETENTION,
+    OUTBOX_FAILED_RETENTION,
+    OUTBOX_CLEANUP_INTERVAL,
+    OUTBOX_FLUSH_TIMEOUT,
+    OUTBOX_MAX_ATTEMPTS
+)
+from database.database import session
+from database.models import OutboxEvent
+from kafka.producer import producer_for
+from kafka.serializers import serializer
+from metrics import Counter, Gauge
+
+
+outbox_published = Counter(
+    "outbox_published_total",
+    "События outbox, опубликованные в Kafka"
+)
+outbox_dead_lettered = Counter(
+    "outbox_dead_lettered_total",
+    "События outbox, отложенные после OUTBOX_MAX_ATTEMPTS ошибок доставки"
+)
+outbox_lag_events = Gauge(
+    "outbox_lag_events",
+    "Количество неотправленных событий outbox"
+)
+outbox_lag_seconds = Gauge(
+    "outbox_lag_seconds",
+    "Возраст самого старого неотправленного события outbox"
+)
+
+# Ключ advisory lock, под которым публикует только один релей из всех подов,
+# чтобы события уходили в Kafka в порядке записи
+OUTBOX_LOCK_KEY = 7_310_001
+
+
+def enqueue_event(
+    session_db: Session,
+    topic: str,
+    payload: dict,
+    target_service: str = "?"
+) -> None:
+    """
+    Запись события в outbox в транзакции сессии. Событие будет
+    опубликовано релеем после коммита
+
+    :param session_db: сессия базы данных
+    :param topic: топик Kafka
+    :param payload: данные сообщения
+    :param target_service: сервис-получатель, для логов
+    """
+    session_db.add(OutboxEvent(
+        topic=topic,
+        payload=payload,
+        target_service=target_service
+    ))
+
+
+def _publish(events: list[OutboxEvent]) -> tuple[set[int], dict[int, str]]:
+    """
+    Публикация пачки событий
+
+    :return: id событий, подтвержденных брокером, и ошибки по id событий,
+        которые брокер или продюсер отклонили
+    """
+    acked: set[int] = set()
+    errors: dict[int, str] = {}
+
+    def on_delivery(event_id: int):
+        def callback(err, msg):
+            if err is None:
+                acked.add(event_id)
+            else:
+                errors[event_id] = str(err)
+                logger.error(
+                    f"[Outbox] Ошибка доставки события {event_id} "
+                    f"в '{msg.topic()}': {err}"
+                )
+        return callback
+
+    used = {}
+    for event in events:
+        topic_producer = producer_for(event.topic)
+        try:
+            topic_producer.produce(
+                event.topic,
+                serializer.dumps(event.payload),
+                on_delivery=on_delivery(event.id)
+            )
+        except BufferError:
+            # Локальная очередь продюсера заполнена, остаток пачки
+            # будет отправлен в следующий раз
+            break
+        except Exception as e:
+            # Например, сообщение больше допустимого размера
+            errors[event.id] = str(e)
+            logger.error(
+                f"[Outbox] Событие {event.id} не принято продюсером "
+                f"для '{event.topic}': {e}"
+            )
+            continue
+        used[id(topic_producer)] = topic_producer
+    for topic_producer in used.values():
+        topic_producer.flush(OUTBOX_FLUSH_TIMEOUT)
+
+    return acked, errors
+
+
+def relay_batch() -> int:
+    """
+    Публикация одной пачки неотправленных событий
+
+    :return: количество опубликованных событий
+    """
+    with session() as session_db:
+        locked = session_db.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"),
+            {"key": OUTBOX_LOCK_KEY}
+        ).scalar()
+        if not locked:
+            return 0
+
+        events = session_db.execute(
+            select(OutboxEvent)
+            .where(
+                OutboxEvent.sent_at.is_(None),
+                OutboxEvent.failed_at.is_(None)
+            )
+            .order_by(OutboxEvent.id)
+            .limit(OUTBOX_BATCH_SIZE)
+        ).scalars().all()
+        if not events:
+            return 0
+
+        acked, errors = _publish(events)
+        now = datetime.utcnow()
+
+        delivered = []
+        for event in events:
+            if event.id in acked:
+                delivered.append(event.id)
+                continue
+            if event.id not in errors:
+                # Не дождались подтверждения: останавливаемся, чтобы не
+                # нарушить порядок. Остаток пачки будет отправлен повторно
+                break
+
+            event.attempts += 1
+            event.last_error = errors[event.id][:255]
+            if event.attempts < OUTBOX_MAX_ATTEMPTS:
+                break
+
+            # Событие, которое не удается доставить, откладывается,
+            # чтобы не блокировать публикацию остальных
+            event.failed_at = now
+            outbox_dead_lettered.inc()
+            logger.error(
+                f"[Outbox] Событие {event.id} для '{event.topic}' отложено "
+                f"после {event.attempts} попыток: {event.last_error}"
+            )
+
+        if delivered:
+            session_db.execute(
+                update(OutboxEvent)
+                .where(OutboxEvent.id.in_(delivered))
+                .values(sent_at=now)
+            )
+        session_db.commit()
+
+        outbox_published.inc(len(delivered))
+        return len(delivered)
+
+
+def update_lag_metrics() -> None:
+    with session() as session_db:
+        count, oldest = session_db.execute(
+            select(func.count(), func.min(OutboxEvent.created_at))
+            .where(
+                OutboxEvent.sent_at.is_(None),
+                OutboxEvent.failed_at.is_(None)
+            )
+        ).one()
+
+    outbox_lag_events.set(count)
+    outbox_lag_seconds.set(
+        (datetime.utcnow() - oldest).total_seconds() if oldest else 0
+    )
+
+
+def cleanup_events() -> None:
+    """
+    Удаление отправленных событий старше OUTBOX_RETENTION и отложенных
+    событий старше OUTBOX_FAILED_RETENTION
+    """
+    now = datetime.utcnow()
+    with session() as session_db:
+        sent = session_db.execute(
+            delete(OutboxEvent).where(
+                OutboxEvent.sent_at < now - OUTBOX_RETENTION
+            )
+        )
+        failed = session_db.execute(
+            delete(OutboxEvent).where(
+                OutboxEvent.failed_at < now - OUTBOX_FAILED_RETENTION
+            )
+        )
+        session_db.commit()
+
+    if sent.rowcount:
+        logger.info(f"[Outbox] Удалено отправленных событий: {sent.rowcount}")
+    if failed.rowcount:
+        logger.warning(
+            f"[Outbox] Удалено отложенных событий без доставки: {failed.rowcount}"
+        )
+
+
+def requeue_failed_events(event_ids: list[int] | None = None) -> int:
+    """
+    Возврат отложенных событий в очередь релея со сбросом счетчика
+    попыток. Релей публикует их первыми, в порядке id
+
+    :param event_ids: id событий, по умолчанию все отложенные
+    :return: количество возвращенных событий
+    """
+    query = (
+        update(OutboxEvent)
+        .where(OutboxEvent.failed_at.is_not(None))
+        .values(failed_at=None, attempts=0)
+    )
+    if event_ids:
+        query = query.where(OutboxEvent.id.in_(event_ids))
+
+    with session() as session_db:
+        result = session_db.execute(query)
+        session_db.commit()
+
+    if result.rowcount:
+        logger.info(f"[Outbox] Возвращено в очередь событий: {result.rowcount}")
+    return result.rowcount
+
+
+def start_outbox_relay() -> None:
+    logger.info("[Outbox] Запущен релей событий в Kafka...")
+    cleaned_at = 0.0
+    while True:
+        try:
+            published = relay_batch()
+            update_lag_metrics()
+
+            if time.monotonic() - cleaned_at > OUTBOX_CLEANUP_INTERVAL:
+                cleanup_events()
+                cleaned_at = time.monotonic()
+
+        except Exception as e:
+            logger.error(f"[Outbox] Ошибка релея событий: {e}")
+            published = 0
+
+        # Полная пачка - вероятно, есть еще события, читаем сразу
+        if published < OUTBOX_BATCH_SIZE:
+            time.sleep(OUTBOX_POLL_INTERVAL)
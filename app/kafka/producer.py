@@ -1,23 +1,215 @@
-import json
+import atexit
+import time
+from contextlib import contextmanager
+from typing import Callable
+from threading import Event, Lock, Thread, local
 
 from confluent_kafka import Producer
-from config import logger, KAFKA_ADDRESS
+from config import (
+    logger,
+    KAFKA_ADDRESS,
+    KAFKA_PRODUCER_ASYNC,
+    KAFKA_LINGER_MS,
+    KAFKA_BATCH_SIZE,
+    KAFKA_COMPRESSION,
+    KAFKA_TOPIC_COMPRESSION,
+    KAFKA_FLUSH_TIMEOUT,
+    KAFKA_COALESCED_TOPICS,
+    KAFKA_COALESCE_WINDOW_MS,
+    KAFKA_COALESCE_MAX_PENDING
+)
+from kafka.client import create_producer
+from kafka.coalescing import CoalescingPublisher
+from kafka.serializers import serializer
+from metrics import Counter
 
-producer = Producer({'bootstrap.servers': KAFKA_ADDRESS})
+
+def _create_producer(compression: str) -> Producer:
+    return create_producer({
+        'bootstrap.servers': KAFKA_ADDRESS,
+        'linger.ms': KAFKA_LINGER_MS,
+        'batch.size': KAFKA_BATCH_SIZE,
+        'compression.type': compression
+    })
+
+
+# Сжатие задается на уровне продюсера, поэтому для каждого кодека из
+# KAFKA_TOPIC_COMPRESSION держим отдельный продюсер
+producer = _create_producer(KAFKA_COMPRESSION)
+_producers: dict[str, Producer] = {KAFKA_COMPRESSION: producer}
+_producers_lock = Lock()
+
+
+def producer_for(topic: str) -> Producer:
+    """
+    Продюсер со сжатием, настроенным для топика
+
+    :param topic: топик Kafka
+    :return: Producer
+    """
+    compression = KAFKA_TOPIC_COMPRESSION.get(topic, KAFKA_COMPRESSION)
+    if compression not in _producers:
+        with _producers_lock:
+            if compression not in _producers:
+                _producers[compression] = _create_producer(compression)
+
+    return _producers[compression]
+
+
+kafka_delivered = Counter(
+    "kafka_produce_delivered_total",
+    "Сообщения, доставленные в Kafka"
+)
+kafka_failed = Counter(
+    "kafka_produce_failed_total",
+    "Сообщения, которые не удалось доставить в Kafka"
+)
+
+_deferred = local()
+
+_poller: Thread | None = None
+_poller_lock = Lock()
+_stopped = Event()
+
+
+def _poll_loop() -> None:
+    # Обслуживание delivery callbacks, пока продюсер работает асинхронно
+    while not _stopped.is_set():
+        for instance in list(_producers.values()):
+            instance.poll(0.1 / len(_producers))
+
+
+def _ensure_poller() -> None:
+    global _poller
+    if _poller is not None:
+        return
+
+    with _poller_lock:
+        if _poller is None:
+            _poller = Thread(target=_poll_loop, name="kafka-poller", daemon=True)
+            _poller.start()
+
+
+@atexit.register
+def flush_producer() -> None:
+    """
+    Отправка накопленных сообщений при остановке процесса
+    """
+    for publisher in _coalescers.values():
+        publisher.flush()
+
+    _stopped.set()
+    remaining = sum(
+        instance.flush(KAFKA_FLUSH_TIMEOUT) for instance in _producers.values()
+    )
+    if remaining:
+        logger.error(
+            f"[Kafka Продюсер] При остановке не отправлено сообщений: {remaining}"
+        )
+
+
+def _delivery_callback(log_prefix: str, started_at: float):
+    def callback(err, msg):
+        if err is not None:
+            kafka_failed.inc()
+            logger.error(
+                f"[Kafka Продюсер]: {log_prefix} Ошибка доставки в '{msg.topic()}': {err}"
+            )
+            return
+
+        kafka_delivered.inc()
+        logger.info(
+            f"[Kafka Продюсер: {log_prefix}] Сообщение успешно отправлено в "
+            f"'{msg.topic()}' за {(time.monotonic() - started_at) * 1000:.1f} мс"
+        )
+    return callback
+
+
+@contextmanager
+def deferred_messages():
+    """
+    Отложенная отправка сообщений текущего потока. Сообщения копятся
+    в буфере и отправляются при выходе из блока без исключения, например
+    после коммита транзакции. При исключении буфер отбрасывается.
+    Буфер можно укоротить, чтобы отменить сообщения откатившейся операции
+
+    :return: список отложенных сообщений (topic, payload, target_service, on_sent)
+    """
+    buffer = []
+    _deferred.buffer = buffer
+    try:
+        yield buffer
+    finally:
+        _deferred.buffer = None
+
+    for topic, payload, target_service, on_sent in buffer:
+        send_message_to_kafka(topic, payload, target_service, on_sent)
 
 
 def send_message_to_kafka(
-    topic: str, payload: dict, target_service: str = "?"
+    topic: str,
+    payload: dict,
+    target_service: str = "?",
+    on_sent: Callable[[str, dict, str], None] | None = None
 ) -> None:
+    """
+    Отправка сообщения в Kafka
+
+    :param on_sent: вызывается после передачи сообщения продюсеру,
+        при отложенной отправке - только после коммита
+    """
+    buffer = getattr(_deferred, "buffer", None)
+    if buffer is not None:
+        buffer.append((topic, payload, target_service, on_sent))
+        return
+
+    publisher = _coalescers.get(topic)
+    if publisher is not None:
+        publisher.publish(payload, target_service)
+    elif not _produce(topic, payload, target_service):
+        return
+
+    if on_sent is not None:
+        log_prefix = f"AUTH -> Kafka -> {target_service.upper()}"
+        try:
+            on_sent(topic, payload, target_service)
+        except Exception as e:
+            logger.error(f"[Kafka Продюсер]: {log_prefix} Ошибка в on_sent: {e}")
+
+
+def _produce(topic: str, payload: dict, target_service: str) -> bool:
     log_prefix = f"AUTH -> Kafka -> {target_service.upper()}"
     logger.info(
         f"[Kafka Продюсер: {log_prefix}] Отправка сообщения в топик '{topic}': {payload}"
     )
+    on_delivery = _delivery_callback(log_prefix, time.monotonic())
     try:
-        producer.produce(topic, json.dumps(payload).encode("utf-8"))
-        producer.flush()
-        logger.info(
-            f"[Kafka Продюсер: {log_prefix}] Сообщение успешно отправлено в '{topic}'"
-        )
+        value = serializer.dumps(payload)
+        topic_producer = producer_for(topic)
+        try:
+            topic_producer.produce(topic, value, on_delivery=on_delivery)
+        except BufferError:
+            # Локальная очередь переполнена, ждем освобождения места
+            topic_producer.poll(1.0)
+            topic_producer.produce(topic, value, on_delivery=on_delivery)
+
+        if KAFKA_PRODUCER_ASYNC:
+            _ensure_poller()
+        else:
+            topic_producer.flush()
     except Exception as e:
+        kafka_failed.inc()
         logger.error(f"[Kafka Продюсер]: {log_prefix} Ошибка при отправке в '{topic}': {e}")
+        return False
+
+    return True
+
+
+# Топики, где scoreboard и другим сервисам нужно только последнее значение
+_coalescers: dict[str, CoalescingPublisher] = {
+    topic: CoalescingPublisher(
+        topic, key_field, KAFKA_COALESCE_WINDOW_MS / 1000,
+        KAFKA_COALESCE_MAX_PENDING, _produce
+    )
+    for topic, key_field in KAFKA_COALESCED_TOPICS.items()
+} if KAFKA_COALESCE_WINDOW_MS > 0 else {}
@@ -0,0 +1,163 @@
+from typing import Callable
+
+from pydantic import BaseModel
+
+from config import (
+    logger,
+    KAFKA_LANES,
+    KAFKA_LANE_QUEUE_SIZE,
+    KAFKA_CONSUME_BATCH_SIZE,
+    KAFKA_WORKER_GROUPS,
+    KAFKA_TOPIC_SETTINGS
+)
+from kafka.schemas import (
+    BalanceReserveRequest,
+    BalanceCompensateRequest,
+    GuildWarDeclareRequest,
+    GuildWarCompensateRequest
+)
+from kafka.handlers.shop.balance_reserve import handle_balance_reserve
+from kafka.handlers.shop.balance_compensate import handle_balance_compensate
+from kafka.handlers.guild.guild_war_declare import handle_guild_war_declare
+from kafka.handlers.guild.guild_war_compensate import (
+    handle_guild_war_compensate, handle_guild_war_compensate_batch
+)
+
+
+class WorkerGroup:
+    """
+    Пул упорядоченных очередей для топиков группы. Сообщения одного
+    пользователя из всех топиков группы попадают в одну очередь,
+    поэтому резервирование и компенсация не обгоняют друг друга
+    """
+
+    SETTINGS = {"workers": int, "batch_size": int, "queue_size": int}
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = KAFKA_LANES,
+        batch_size: int = KAFKA_CONSUME_BATCH_SIZE,
+        queue_size: int = KAFKA_LANE_QUEUE_SIZE
+    ) -> None:
+        self.name = name
+        self.workers = workers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+
+    def __repr__(self):
+        return (
+            f"<WorkerGroup {self.name}: workers={self.workers}, "
+            f"batch_size={self.batch_size}, queue_size={self.queue_size}>"
+        )
+
+
+class TopicHandler:
+    """
+    Обработка топика: обработчик, схема сообщения, группа воркеров
+    и повторы при ошибке
+    """
+
+    SETTINGS = {"retries": int, "retry_backoff": float}
+
+    def __init__(
+        self,
+        topic: str,
+        handler: Callable,
+        description: str,
+        schema: type[BaseModel],
+        group: str,
+        batch_handler: Callable | None = None,
+        transaction_id: Callable[[dict], str] | None = None,
+        retries: int = 2,
+        retry_backoff: float = 0.5
+    ) -> None:
+        """
+        :param batch_handler: обработчик всех сообщений топика из пачки разом
+        :param transaction_id: идентификатор транзакции с префиксом,
+            по которому проверяются повторно доставленные сообщения
+        :param retries: повторов сообщения, откатившегося с ошибкой,
+            сразу внутри пачки. Ошибки данных не повторяются
+        :param retry_backoff: пауза в секундах перед повтором, если не
+            удалась вся транзакция, удваивается с каждой попыткой
+        """
+        self.topic = topic
+        self.handler = handler
+        self.description = description
+        self.schema = schema
+        self.group = group
+        self.batch_handler = batch_handler
+        self.transaction_id = transaction_id
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+
+    def __repr__(self):
+        return (
+            f"<TopicHandler {self.topic}: group={self.group}, "
+            f"retries={self.retries}, retry_backoff={self.retry_backoff}>"
+        )
+
+
+def _apply_settings(target, settings: dict) -> None:
+    for name, value in settings.items():
+        if name not in target.SETTINGS:
+            logger.warning(f"[Kafka Консьюмер] Неизвестная настройка {name} для {target}")
+            continue
+        setattr(target, name, target.SETTINGS[name](value))
+
+
+WORKER_GROUPS = {
+    # Резервирование в магазине ждет пользователь, ему больше воркеров
+    "shop": WorkerGroup("shop"),
+    "guild": WorkerGroup("guild", workers=max(KAFKA_LANES // 2, 1))
+}
+
+# Обработчики топиков консьюмера. Внутри пачки сообщения применяются
+# в порядке получения, а не в порядке топиков
+TOPICS = {
+    handler.topic: handler for handler in [
+        TopicHandler(
+            "shop.balance.reserve.request.auth",
+            handle_balance_reserve,
+            "Обработка запроса на резервирование баланса от shop",
+            BalanceReserveRequest,
+            group="shop",
+            transaction_id=lambda data: f"shop:{data['transaction_id']}"
+        ),
+        TopicHandler(
+            "shop.balance.compensate.request.auth",
+            handle_balance_compensate,
+            "Обработка запроса на компенсацию баланса от shop",
+            BalanceCompensateRequest,
+            group="shop"
+        ),
+        TopicHandler(
+            "initiator_guild_wants_declare_war",
+            handle_guild_war_declare,
+            "Обработка запроса разрещение объявления войны гильдий от guilds",
+            GuildWarDeclareRequest,
+            group="guild",
+            transaction_id=lambda data: f"guild:{data['correlation_id']}"
+        ),
+        TopicHandler(
+            "guild_war_canceled_declined_expired",
+            handle_guild_war_compensate,
+            "Обработка запроса на компенсацию баланса от guilds",
+            GuildWarCompensateRequest,
+            group="guild",
+            batch_handler=handle_guild_war_compensate_batch
+        )
+    ]
+}
+
+for _name, _settings in KAFKA_WORKER_GROUPS.items():
+    if _name in WORKER_GROUPS:
+        _apply_settings(WORKER_GROUPS[_name], _settings)
+    else:
+        logger.warning(f"[Kafka Консьюмер] Неизвестная группа воркеров: {_name}")
+
+for _topic, _settings in KAFKA_TOPIC_SETTINGS.items():
+    if _topic in TOPICS:
+        _apply_settings(TOPICS[_topic], _settings)
+    else:
+        logger.warning(f"[Kafka Консьюмер] Неизвестный топик в настройках: {_topic}")
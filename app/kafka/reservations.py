@@ -0,0 +1,116 @@
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from config import (
+    logger,
+    RESERVATION_TTL,
+    RESERVATION_EXPIRY_POLICY,
+    RESERVATION_SWEEP_BATCH_SIZE,
+    RESERVATION_SWEEP_INTERVAL
+)
+from database.database import session
+from database.models import UserTransaction, TransactionStatus, CurrencyType
+from kafka.producer import deferred_messages, send_message_to_kafka
+from kafka.services import refund_balances
+from metrics import Counter
+
+
+EXPIRY_POLICIES = {
+    # Резервирование считается состоявшимся списанием. Статус отличается
+    # от COMPLETED (компенсировано), поэтому поздняя компенсация его вернет
+    "charge": TransactionStatus.EXPIRED,
+    # Средства возвращаются пользователю, транзакция помечается FAILED
+    "refund": TransactionStatus.FAILED
+}
+
+reservations_expired = Counter(
+    "reservations_expired_total",
+    "Зависшие резервирования, завершенные по истечении срока"
+)
+
+
+def expire_reservations(policy: str = RESERVATION_EXPIRY_POLICY) -> int:
+    """
+    Завершение одной пачки резервирований старше RESERVATION_TTL.
+    Строки блокируются с SKIP LOCKED, поэтому несколько подов разбирают
+    разные пачки, а компенсация той же транзакции ждет коммита и видит
+    уже новый статус
+
+    :param policy: charge или refund
+    :return: количество завершенных резервирований
+    """
+    status = EXPIRY_POLICIES[policy]
+    with session() as session_db, deferred_messages():
+        stale = session_db.execute(
+            select(
+                UserTransaction.id,
+                UserTransaction.user_id,
+                UserTransaction.currency_type,
+                UserTransaction.amount
+            )
+            .where(
+                UserTransaction.status == TransactionStatus.RESERVED,
+                UserTransaction.created_at < datetime.utcnow() - RESERVATION_TTL
+            )
+            .order_by(UserTransaction.created_at)
+            .limit(RESERVATION_SWEEP_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not stale:
+            return 0
+
+        if status == TransactionStatus.FAILED:
+            refunds: dict = defaultdict(lambda: defaultdict(int))
+            for row in stale:
+                refunds[row.currency_type][row.user_id] += row.amount
+            for currency, amounts in refunds.items():
+                balances = refund_balances(session_db, currency, amounts)
+                if currency == CurrencyType.GOLD:
+                    # Таблица лидеров получает баланс после возврата
+                    for user_id, balance in balances.items():
+                        send_message_to_kafka(
+                            topic="prod.auth.fact.currency-change.1",
+                            payload={"user_id": user_id, "gold": balance},
+                            target_service="scoreboard"
+                        )
+
+        session_db.execute(
+            update(UserTransaction)
+            .where(UserTransaction.id.in_([row.id for row in stale]))
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        session_db.commit()
+
+    reservations_expired.inc(len(stale))
+    logger.info(
+        f"[Резервирования] Завершено зависших резервирований: {len(stale)}, статус {status}"
+    )
+    return len(stale)
+
+
+def start_reservation_sweeper() -> None:
+    if RESERVATION_EXPIRY_POLICY not in EXPIRY_POLICIES:
+        logger.error(
+            f"[Резервирования] Неизвестная политика '{RESERVATION_EXPIRY_POLICY}', "
+            f"очистка зависших резервирований отключена"
+        )
+        return
+
+    logger.info(
+        f"[Резервирования] Запущена очистка зависших резервирований, "
+        f"политика {RESERVATION_EXPIRY_POLICY}"
+    )
+    while True:
+        try:
+            expired = expire_reservations()
+        except Exception as e:
+            logger.error(f"[Резервирования] Ошибка очистки резервирований: {e}")
+            expired = 0
+
+        # Полная пачка - вероятно, есть еще зависшие, продолжаем сразу
+        if expired < RESERVATION_SWEEP_BATCH_SIZE:
+            time.sleep(RESERVATION_SWEEP_INTERVAL)
@@ -0,0 +1,33 @@
+from pydantic import BaseModel
+
+
+class KafkaMessage(BaseModel):
+    # Идентификаторы других сервисов могут прийти числом
+    class Config:
+        coerce_numbers_to_str = True
+
+
+class BalanceReserveRequest(KafkaMessage):
+    transaction_id: str
+    user_id: int
+    cost: int
+    currency_type: str
+
+
+class BalanceCompensateRequest(KafkaMessage):
+    transaction_id: str
+    user_id: int
+    cost: int
+    currency_type: str
+
+
+class GuildWarDeclareRequest(KafkaMessage):
+    initiator_guild_id: int
+    initiator_owner_id: int
+    correlation_id: str
+
+
+class GuildWarCompensateRequest(KafkaMessage):
+    initiator_owner_id: int
+    correlation_id: str
+    status: str
@@ -0,0 +1,71 @@
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from config import logger, KAFKA_SERIALIZER
+
+
+class JSONSerializer:
+    """
+    Сериализация stdlib json
+    """
+    name = "json"
+
+    @staticmethod
+    def dumps(payload: Any) -> bytes:
+        return json.dumps(payload).encode("utf-8")
+
+    @staticmethod
+    def loads(value: bytes) -> Any:
+        # json.loads принимает bytes в UTF-8 без явного decode
+        return json.loads(value)
+
+
+class OrjsonSerializer:
+    """
+    Сериализация orjson, работает сразу с bytes
+    """
+    name = "orjson"
+
+    @staticmethod
+    def dumps(payload: Any) -> bytes:
+        return orjson.dumps(payload)
+
+    @staticmethod
+    def loads(value: bytes) -> Any:
+        return orjson.loads(value)
+
+
+SERIALIZERS = {
+    JSONSerializer.name: JSONSerializer,
+    OrjsonSerializer.name: OrjsonSerializer
+}
+
+# Ошибки разбора обоих бэкендов, orjson.JSONDecodeError наследует ValueError
+DecodeError = ValueError
+
+
+def get_serializer(name: str = "auto"):
+    """
+    Бэкенд сериализации сообщений Kafka
+
+    :param name: json, orjson или auto - orjson, если установлен
+    :return: класс сериализатора
+    """
+    if name == "auto":
+        name = "orjson" if orjson is not None else "json"
+
+    if name == "orjson" and orjson is None:
+        logger.warning(
+            "[Kafka] orjson не установлен, используется стандартный json"
+        )
+        name = "json"
+
+    return SERIALIZERS[name]
+
+
+serializer = get_serializer(KAFKA_SERIALIZER)
@@ -1,10 +1,97 @@
+from datetime import datetime
+
 from database.models import (
     UserBase, UserCurrency, UserTransaction, CurrencyType, TransactionStatus
 )
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Integer, update, insert, select, exists, case, cast, literal, tuple_,
+    values, column
+)
+from sqlalchemy.orm import Session, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from cache import MISS
+
+
+def prefetch_user_currencies(session_db: Session, user_ids) -> None:
+    """
+    Загрузка валют всех пользователей пачки сообщений одним запросом.
+    Результат хранится в session_db.info и используется обработчиками.
+    Строки блокируются сразу в порядке user_id, поэтому пачки разных
+    очередей с общими пользователями ждут друг друга, а не взаимно
+    блокируются
+    """
+    user_ids = {int(user_id) for user_id in user_ids if _is_id(user_id)}
+    currencies = session_db.query(UserCurrency).filter(
+        UserCurrency.user_id.in_(user_ids)
+    ).order_by(UserCurrency.user_id).with_for_update().all()
+
+    prefetched = dict.fromkeys(user_ids)
+    prefetched.update((currency.user_id, currency) for currency in currencies)
+    session_db.info["user_currencies"] = prefetched
+
+
+def prefetch_transactions(session_db: Session, transaction_ids) -> None:
+    """
+    Загрузка уже существующих транзакций пачки одним запросом по
+    уникальному индексу transaction_id. Отсутствующие отмечаются None
+    """
+    transaction_ids = set(transaction_ids)
+    transactions = session_db.query(UserTransaction).filter(
+        UserTransaction.transaction_id.in_(transaction_ids)
+    ).all()
+
+    prefetched = dict.fromkeys(transaction_ids)
+    prefetched.update(
+        (transaction.transaction_id, transaction) for transaction in transactions
+    )
+    session_db.info["transactions"] = prefetched
+
+
+def find_transaction(
+    session_db: Session, transaction_id: str
+) -> UserTransaction | None:
+    """
+    Поиск транзакции по идентификатору с префиксом, сначала среди
+    загруженных для пачки
+    """
+    prefetched = session_db.info.get("transactions", {})
+    if transaction_id in prefetched:
+        return prefetched[transaction_id]
+
+    return session_db.query(UserTransaction).filter_by(
+        transaction_id=transaction_id
+    ).first()
+
+
+def get_transaction_statuses(
+    session_db: Session, transaction_ids
+) -> dict[str, TransactionStatus]:
+    rows = session_db.query(
+        UserTransaction.transaction_id, UserTransaction.status
+    ).filter(UserTransaction.transaction_id.in_(transaction_ids))
+    return {transaction_id: status for transaction_id, status in rows}
+
+
+def _is_id(user_id) -> bool:
+    return isinstance(user_id, int) or (
+        isinstance(user_id, str) and user_id.isdigit()
+    )
+
+
+def _prefetched_currency(session_db: Session, user_id):
+    prefetched = session_db.info.get("user_currencies", {})
+    if not _is_id(user_id) or int(user_id) not in prefetched:
+        return MISS
+
+    return prefetched[int(user_id)]
 
 
 def user_exists(session_db: Session, user_id) -> bool:
+    # Строка валют создается вместе с пользователем
+    if _prefetched_currency(session_db, user_id) not in (MISS, None):
+        return True
+
     return session_db.query(UserBase).filter_by(id=user_id).first() is not None
 
 
@@ -19,23 +106,185 @@ def get_user_transaction(
 def get_user_currency(
     session_db: Session, user_id: int
 ) -> UserCurrency | None:
+    currency = _prefetched_currency(session_db, user_id)
+    if currency is not MISS:
+        return currency
+
     return session_db.query(UserCurrency).filter_by(user_id=user_id).first()
 
 
-def process_compensation(
+def _sync_balance(
     session_db: Session,
-    user_currency: UserCurrency,
+    user_id: int,
     currency: CurrencyType,
-    amount: int,
-    transaction: UserTransaction
+    balance: int
 ) -> None:
-    setattr(
-        user_currency,
-        currency.value,
-        getattr(user_currency, currency.value) + amount
+    # Баланс изменен запросом в обход ORM: обновляем загруженный объект
+    # без пометки об изменении, чтобы flush не перезаписал значение
+    user_currency = _prefetched_currency(session_db, user_id)
+    if user_currency is MISS:
+        user_currency = next((
+            instance for instance in session_db.identity_map.values()
+            if isinstance(instance, UserCurrency) and instance.user_id == int(user_id)
+        ), None)
+
+    if user_currency is not None:
+        set_committed_value(user_currency, currency.value, balance)
+
+
+def reserve_balance(
+    session_db: Session,
+    transaction_id: str,
+    user_id: int,
+    currency: CurrencyType,
+    amount: int
+) -> tuple[UserTransaction, int | None]:
+    """
+    Атомарное резервирование: условное списание и запись транзакции одним
+    запросом. Баланс уменьшается, только если его хватает, поэтому
+    параллельные резервирования одного пользователя не теряют обновления
+
+    :param transaction_id: идентификатор транзакции с префиксом
+    :return: (транзакция со статусом RESERVED или DECLINED,
+        остаток после списания или None, если списания не было)
+    """
+    balance = getattr(UserCurrency, currency.value)
+    status_type = UserTransaction.status.type
+    currency_type = UserTransaction.currency_type.type
+    now = datetime.utcnow()
+
+    reserved = (
+        update(UserCurrency)
+        .where(UserCurrency.user_id == user_id, balance >= amount)
+        .values({balance: balance - amount})
+        .returning(balance.label("balance"))
+        .cte("reserved")
     )
-    transaction.status = TransactionStatus.COMPLETED
-    session_db.commit()
+    status = case(
+        (
+            exists(select(reserved.c.balance)),
+            literal(TransactionStatus.RESERVED, status_type)
+        ),
+        else_=literal(TransactionStatus.DECLINED, status_type)
+    )
+    row = session_db.execute(
+        insert(UserTransaction)
+        .from_select(
+            [
+                "transaction_id", "user_id", "currency_type",
+                "amount", "status", "created_at"
+            ],
+            select(
+                literal(transaction_id),
+                literal(user_id),
+                cast(literal(currency, currency_type), currency_type),
+                literal(amount),
+                cast(status, status_type),
+                literal(now)
+            )
+        )
+        .returning(
+            UserTransaction.id,
+            UserTransaction.status,
+            select(reserved.c.balance).scalar_subquery().label("balance")
+        )
+        .add_cte(reserved)
+    ).one()
+
+    # Строка уже вставлена, объект добавляется в сессию без повторного INSERT
+    transaction = create_user_transaction_object(
+        transaction_id, user_id, currency, amount, row.status
+    )
+    transaction.id = row.id
+    transaction.created_at = now
+    make_transient_to_detached(transaction)
+    session_db.add(transaction)
+
+    prefetched = session_db.info.get("transactions")
+    if prefetched is not None:
+        prefetched[transaction_id] = transaction
+
+    if row.balance is not None:
+        _sync_balance(session_db, user_id, currency, row.balance)
+
+    return transaction, row.balance
+
+
+def complete_reservations(
+    session_db: Session,
+    transactions: dict[str, int]
+) -> list:
+    """
+    Перевод зарезервированных транзакций в COMPLETED одним запросом.
+    Истекшие резервирования (EXPIRED) тоже компенсируются, средства за них
+    не возвращались. Транзакции в другом статусе не затрагиваются, поэтому
+    повторная компенсация ничего не возвращает
+
+    :param transactions: идентификатор транзакции с префиксом -> id пользователя
+    :return: строки (transaction_id, user_id, currency_type, amount) завершенных транзакций
+    """
+    if not transactions:
+        return []
+
+    rows = session_db.execute(
+        update(UserTransaction)
+        .where(
+            tuple_(UserTransaction.transaction_id, UserTransaction.user_id).in_(
+                [(transaction_id, int(user_id)) for transaction_id, user_id in transactions.items()]
+            ),
+            UserTransaction.status.in_(
+                (TransactionStatus.RESERVED, TransactionStatus.EXPIRED)
+            )
+        )
+        .values(status=TransactionStatus.COMPLETED)
+        .returning(
+            UserTransaction.transaction_id,
+            UserTransaction.user_id,
+            UserTransaction.currency_type,
+            UserTransaction.amount
+        )
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    prefetched = session_db.info.get("transactions", {})
+    for row in rows:
+        transaction = prefetched.get(row.transaction_id)
+        if transaction is not None:
+            set_committed_value(transaction, "status", TransactionStatus.COMPLETED)
+
+    return rows
+
+
+def refund_balances(
+    session_db: Session,
+    currency: CurrencyType,
+    refunds: dict[int, int]
+) -> dict[int, int]:
+    """
+    Начисление сумм нескольким пользователям одним UPDATE ... FROM (VALUES ...)
+
+    :param refunds: id пользователя -> сумма
+    :return: id пользователя -> баланс после начисления
+    """
+    if not refunds:
+        return {}
+
+    balance = getattr(UserCurrency, currency.value)
+    refund = values(
+        column("user_id", Integer), column("amount", Integer), name="refund"
+    ).data(list(refunds.items()))
+    rows = session_db.execute(
+        update(UserCurrency)
+        .where(UserCurrency.user_id == refund.c.user_id)
+        .values({balance: balance + refund.c.amount})
+        .returning(UserCurrency.user_id, balance)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    balances = {user_id: new_balance for user_id, new_balance in rows}
+    for user_id, new_balance in balances.items():
+        _sync_balance(session_db, user_id, currency, new_balance)
+    return balances
 
 
 def create_user_transaction_object(
@@ -55,4 +304,8 @@ def save_transaction(
     session_db: Session, transaction: UserTransaction
 ) -> None:
     session_db.add(transaction)
-    session_db.commit()
+    session_db.flush()
+    # Повтор того же сообщения в этой же пачке должен увидеть транзакцию
+    prefetched = session_db.info.get("transactions")
+    if prefetched is not None:
+        prefetched[transaction.transaction_id] = transaction
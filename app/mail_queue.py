@@ -0,0 +1,240 @@
+import json
+import smtplib
+import time
+import uuid
+from threading import Thread
+
+from flask import Flask
+from flask_mail import Message
+from redis.exceptions import RedisError
+
+from config import (
+    logger,
+    MAIL_WORKERS,
+    MAIL_BATCH_SIZE,
+    MAIL_MAX_ATTEMPTS,
+    MAIL_RETRY_BACKOFF,
+    MAIL_VISIBILITY_TIMEOUT,
+    MAIL_CONNECTION_IDLE,
+    MAIL_POLL_INTERVAL
+)
+from extensions import mail, mail_queue_redis
+from metrics import Counter, Histogram
+
+
+mail_delivery_seconds = Histogram(
+    "mail_delivery_seconds",
+    "Время от постановки письма в очередь до отправки",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0)
+)
+mail_sent = Counter("mail_sent_total", "Отправленные письма")
+mail_retried = Counter("mail_retried_total", "Письма, отложенные для повтора")
+mail_failed = Counter(
+    "mail_failed_total",
+    "Письма, не отправленные после всех попыток"
+)
+
+QUEUE_KEY = "mail:queue"
+INFLIGHT_KEY = "mail:inflight"
+RETRY_KEY = "mail:retry"
+DEAD_KEY = "mail:dead"
+
+# Забирает пачку писем и помечает их как взятые в работу до дедлайна.
+# Если воркер упадет, письма вернутся в очередь после дедлайна
+CLAIM_SCRIPT = """
+local jobs = redis.call("LPOP", KEYS[1], ARGV[1])
+if not jobs then
+    return {}
+end
+for _, job in ipairs(jobs) do
+    redis.call("ZADD", KEYS[2], ARGV[2], job)
+end
+return jobs
+"""
+
+# Возвращает в очередь письма, у которых подошло время повтора,
+# и письма зависших воркеров
+REQUEUE_SCRIPT = """
+local moved = 0
+for i = 2, 3 do
+    local jobs = redis.call("ZRANGEBYSCORE", KEYS[i], "-inf", ARGV[1])
+    for _, job in ipairs(jobs) do
+        redis.call("ZREM", KEYS[i], job)
+        redis.call("RPUSH", KEYS[1], job)
+        moved = moved + 1
+    end
+end
+return moved
+"""
+
+
+def enqueue_mail(subject: str, recipients: list[str], body: str) -> None:
+    """
+    Постановка письма в очередь на отправку
+
+    :param subject: тема письма
+    :param recipients: адреса получателей
+    :param body: текст письма
+    """
+    job = {
+        "id": uuid.uuid4().hex,
+        "subject": subject,
+        "recipients": recipients,
+        "body": body,
+        "attempts": 0,
+        "enqueued_at": time.time()
+    }
+    mail_queue_redis.rpush(QUEUE_KEY, json.dumps(job))
+
+
+class MailWorker:
+    """
+    Воркер очереди писем. Держит открытое SMTP соединение между пачками
+    и переоткрывает его после простоя или ошибки
+    """
+
+    def __init__(self, app: Flask, name: str) -> None:
+        self.app = app
+        self.name = name
+        self.redis = mail_queue_redis
+        self.claim = self.redis.register_script(CLAIM_SCRIPT)
+        self.requeue = self.redis.register_script(REQUEUE_SCRIPT)
+        self.connection = None
+        self.last_used = 0.0
+
+    def run(self) -> None:
+        logger.info(f"[Почта] Воркер {self.name} запущен")
+        with self.app.app_context():
+            while True:
+                try:
+                    if not self.process_batch():
+                        self.close_idle_connection()
+                        time.sleep(MAIL_POLL_INTERVAL)
+
+                except RedisError as e:
+                    logger.error(f"[Почта] Ошибка Redis в воркере {self.name}: {e}")
+                    time.sleep(MAIL_POLL_INTERVAL)
+
+                except Exception as e:
+                    # Взятые письма вернутся в очередь после дедлайна
+                    logger.error(f"[Почта] Ошибка в воркере {self.name}: {e}")
+                    self.close_connection()
+                    time.sleep(MAIL_POLL_INTERVAL)
+
+    def process_batch(self) -> int:
+        """
+        Отправка одной пачки писем
+
+        :return: количество взятых из очереди писем
+        """
+        now = time.time()
+        self.requeue(keys=[QUEUE_KEY, RETRY_KEY, INFLIGHT_KEY], args=[now])
+        raw_jobs = self.claim(
+            keys=[QUEUE_KEY, INFLIGHT_KEY],
+            args=[MAIL_BATCH_SIZE, now + MAIL_VISIBILITY_TIMEOUT]
+        )
+
+        for raw_job in raw_jobs:
+            self.process_job(raw_job)
+            # Письмо снимается с учета, только когда оно отправлено или
+            # переложено в повтор. При ошибке Redis оно вернется в очередь
+            self.redis.zrem(INFLIGHT_KEY, raw_job)
+
+        return len(raw_jobs)
+
+    def process_job(self, raw_job: str) -> None:
+        """
+        Отправка одного письма с переносом в повтор или в список
+        неотправленных при ошибке
+
+        :param raw_job: письмо в виде JSON из очереди
+        """
+        try:
+            job = json.loads(raw_job)
+        except ValueError as e:
+            logger.error(f"[Почта] Не удалось прочитать письмо из очереди: {e}")
+            self.redis.rpush(DEAD_KEY, raw_job)
+            mail_failed.inc()
+            return
+
+        try:
+            self.send(job)
+            mail_sent.inc()
+            mail_delivery_seconds.observe(time.time() - job["enqueued_at"])
+
+        except smtplib.SMTPRecipientsRefused as e:
+            # Повтор не поможет, адрес отклонен сервером
+            logger.error(f"[Почта] Адрес {job['recipients']} отклонен: {e}")
+            self.bury(job)
+
+        except (smtplib.SMTPException, OSError) as e:
+            self.close_connection()
+            self.retry(job, e)
+
+        except Exception as e:
+            # Непредвиденная ошибка не должна терять письмо: оно уходит
+            # в повтор, а после MAIL_MAX_ATTEMPTS попыток в mail:dead
+            logger.error(f"[Почта] Непредвиденная ошибка отправки письма: {e}")
+            self.close_connection()
+            self.retry(job, e)
+
+    def send(self, job: dict) -> None:
+        msg = Message(job["subject"], recipients=job["recipients"])
+        msg.body = job["body"]
+
+        if self.connection is None:
+            self.connection = mail.connect()
+            self.connection.__enter__()
+
+        self.connection.send(msg)
+        self.last_used = time.monotonic()
+
+    def retry(self, job: dict, error: Exception) -> None:
+        job["attempts"] = job.get("attempts", 0) + 1
+        if job["attempts"] >= MAIL_MAX_ATTEMPTS:
+            logger.error(
+                f"[Почта] Письмо {job['id']} не отправлено "
+                f"после {job['attempts']} попыток: {error}"
+            )
+            self.bury(job)
+            return
+
+        delay = MAIL_RETRY_BACKOFF * 2 ** (job["attempts"] - 1)
+        logger.warning(
+            f"[Почта] Ошибка отправки письма {job['id']}, "
+            f"повтор через {delay} с: {error}"
+        )
+        self.redis.zadd(RETRY_KEY, {json.dumps(job): time.time() + delay})
+        mail_retried.inc()
+
+    def bury(self, job: dict) -> None:
+        self.redis.rpush(DEAD_KEY, json.dumps(job))
+        mail_failed.inc()
+
+    def close_idle_connection(self) -> None:
+        if (
+            self.connection is not None and
+            time.monotonic() - self.last_used > MAIL_CONNECTION_IDLE
+        ):
+            self.close_connection()
+
+    def close_connection(self) -> None:
+        if self.connection is None:
+            return
+
+        try:
+            self.connection.__exit__(None, None, None)
+        except Exception:
+            pass
+        self.connection = None
+
+
+def start_mail_workers(app: Flask) -> None:
+    """
+    Запуск пула воркеров очереди писем
+
+    :param app: приложение Flask, в контексте которого отправляются письма
+    """
+    for number in range(MAIL_WORKERS):
+        worker = MailWorker(app, name=f"mail-{number}")
+        Thread(target=worker.run, name=worker.name, daemon=True).start()
@@ -1,10 +1,13 @@
 import os
 
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from threading import Thread
 from kafka.consumer import start_consumer_loop
+from kafka.outbox import start_outbox_relay
+from kafka.reservations import start_reservation_sweeper
 
 from authorization.auth import auth_blueprint
+from authorization.jwks import jwks_blueprint
 from authorization.oauth.google import api_routes # noqa
 from authorization.oauth.yandex import api_routes # noqa
 
@@ -19,25 +22,34 @@ from admin import (
 from database.database import session
 from database.models import UserBase, UserCurrency, UserTransaction
 
-from extensions import jwt_redis_blocklist, oauth, mail
+from extensions import oauth, mail
+from authorization.revocation import token_blocklist
+from authorization.keys import key_manager
+from authorization.renewal import token_renewals
+from authorization.decode_cache import CachingJWTManager
+from authorization.tokens import (
+    token_profile, decode_algorithms, user_claims, read_user_claims
+)
+from metrics import metrics_blueprint
+from rate_limit import limit_request_rate
+from mail_queue import start_mail_workers
 
 from errors import HttpError
 from signals import (
     user_registered_handler, registration_user_signal,
 )
-from flask import Flask, Response, jsonify, make_response
+from flask import Flask, Response, g, jsonify, make_response
 from flasgger import Swagger
-from flask_jwt_extended import JWTManager
 from flask_jwt_extended import (
-    get_jwt,
-    get_jwt_identity,
-    create_access_token,
-    set_access_cookies
+    create_access_token, get_jwt, set_access_cookies
 )
+from redis.exceptions import RedisError
 
 from config import (
     JWT_ACCESS_TOKEN_EXPIRES,
     JWT_REFRESH_TOKEN_EXPIRES,
+    JWT_RENEWAL_WINDOW,
+    JWT_DECODE_CACHE_SIZE,
     logger,
     FLASK_PORT,
     VERSION
@@ -54,7 +66,8 @@ app.config["SWAGGER"] = {"openapi": "3.0.0", "version": VERSION}
 app.config["FLASK_ADMIN_SWATCH"] = "slate"
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = JWT_ACCESS_TOKEN_EXPIRES
 app.config["JWT_REFRESH_TOKEN_EXPIRES"] = JWT_REFRESH_TOKEN_EXPIRES
-app.config["JWT_ALGORITHM"] = "RS256"
+app.config["JWT_ALGORITHM"] = token_profile["algorithm"]
+app.config["JWT_DECODE_ALGORITHMS"] = decode_algorithms()
 app.config["JWT_COOKIE_SECURE"] = True
 app.config["JWT_COOKIE_CSRF_PROTECT"] = True
 
@@ -68,6 +81,10 @@ app.config["MAIL_USE_SSL"] = True
 
 registration_user_signal.connect(user_registered_handler)
 
+app.before_request(limit_request_rate)
+
+app.register_blueprint(jwks_blueprint)
+app.register_blueprint(metrics_blueprint)
 app.register_blueprint(auth_blueprint, url_prefix="/api/v1/auth")
 app.register_blueprint(user_blueprint, url_prefix="/api/v1/users")
 app.register_blueprint(currencies_blueprint, url_prefix="/api/v1/currencies")
@@ -79,19 +96,48 @@ admin.add_view(UserTransactionAdminView(UserTransaction, session()))
 admin.init_app(app)
 
 swagger = Swagger(app, template_file="api_doc.yaml")
-jwt = JWTManager(app)
+jwt = CachingJWTManager(app, decode_cache_size=JWT_DECODE_CACHE_SIZE)
 mail.init_app(app)
 oauth.init_app(app)
 
 
+@jwt.additional_headers_loader
+def add_key_id_header(identity) -> dict:
+    """
+    Выбор ключа подписи и добавление его kid в заголовок токена
+    """
+    # Ключ запоминается до подписи, чтобы ротация между заголовком
+    # и подписью не привела к несовпадению kid
+    g.jwt_signing_key = key_manager.signing_key(app.config["JWT_ALGORITHM"])
+    return {"kid": g.jwt_signing_key.kid}
+
+
+@jwt.encode_key_loader
+def get_encode_key(identity):
+    """
+    Приватный ключ для подписи токена
+    """
+    signing_key = g.pop("jwt_signing_key", None)
+    if signing_key is None:
+        signing_key = key_manager.signing_key(app.config["JWT_ALGORITHM"])
+
+    return signing_key.private_key
+
+
+@jwt.decode_key_loader
+def get_decode_key(jwt_header: dict, jwt_payload: dict):
+    """
+    Публичный ключ для проверки подписи токена по kid
+    """
+    return key_manager.verification_key(jwt_header.get("kid"))
+
+
 @jwt.token_in_blocklist_loader
 def check_if_token_in_blocklist(jwt_header: dict, jwt_payload: dict):
     """
     Проверка, находится ли токен в блок-листе
     """
-    jti = jwt_payload["jti"]
-
-    return jwt_redis_blocklist.get(jti) is not None
+    return token_blocklist.is_revoked(jwt_payload)
 
 
 @app.errorhandler(HttpError)
@@ -110,37 +156,59 @@ def refresh_expiring_jwts(response: Response):
     """
     Функция для неявноего обновления jwt токенов
     """
+    # Данные токена, проверенного в этом запросе. get_jwt() бросает
+    # RuntimeError, если эндпоинт токен не проверял, и возвращает пустой
+    # словарь для jwt_required(optional=True) без токена
     try:
-        exp_timestamp = get_jwt()["exp"]
-        now = datetime.now(timezone.utc)
-        target_timestamp = datetime.timestamp(now + timedelta(minutes=30))
-        if target_timestamp > exp_timestamp:
-            claims = get_jwt()
-            access_token = create_access_token(
-                identity=get_jwt_identity(),
-                additional_claims={
-                    "username": claims["username"],
-                    "role": claims["role"]
-                }
-            )
-            response = make_response(
-                {"access_token": f"Bearer {access_token}"}, 200
-            )
-            set_access_cookies(
-                response,
-                f"Bearer {access_token}",
-                max_age=60*60*24
-            )
+        claims = get_jwt()
+    except RuntimeError:
+        return response
 
-            return response
+    if not claims:
+        return response
 
-    except (RuntimeError, KeyError):
+    now = datetime.now(timezone.utc)
+    if datetime.timestamp(now + JWT_RENEWAL_WINDOW) <= claims["exp"]:
         return response
 
-    finally:
+    try:
+        access_token = token_renewals.renew(
+            claims["jti"],
+            claims["exp"],
+            lambda: create_access_token(
+                identity=claims["sub"],
+                additional_claims=user_claims(**read_user_claims(claims))
+            )
+        )
+
+    except (RedisError, KeyError) as e:
+        logger.error(f"Ошибка при продлении токена: {e}")
         return response
 
+    response = make_response(
+        {"access_token": f"Bearer {access_token}"}, 200
+    )
+    # В cookie кладется сам токен: set_access_cookies выводит из него
+    # CSRF токен и не разбирает префикс Bearer
+    set_access_cookies(
+        response,
+        access_token,
+        max_age=60*60*24
+    )
 
-if __name__ == "__main__":
+    return response
+
+
+def run() -> None:
+    """
+    Запуск фоновых потоков и сервера приложения
+    """
     Thread(target=start_consumer_loop, daemon=True).start()
+    Thread(target=start_outbox_relay, daemon=True).start()
+    Thread(target=start_reservation_sweeper, daemon=True).start()
+    start_mail_workers(app)
     app.run(host="0.0.0.0", port=FLASK_PORT)
+
+
+if __name__ == "__main__":
+    run()
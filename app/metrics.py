@@ -0,0 +1,126 @@
+import hmac
+from bisect import bisect_left
+from threading import Lock
+
+from flask import Blueprint, Response, request
+
+from config import METRICS_TOKEN
+from errors import HttpError
+
+
+metrics_blueprint = Blueprint("Metrics", __name__)
+
+_registry: dict[str, "Metric"] = {}
+
+
+class Metric:
+    """
+    Базовый класс метрики воркера
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._lock = Lock()
+        _registry[name] = self
+
+    def samples(self) -> list[tuple[str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        lines.extend(f"{name} {value}" for name, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """
+    Монотонно растущий счетчик
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Gauge(Metric):
+    """
+    Текущее значение величины
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self.value = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self) -> list[tuple[str, float]]:
+        return [(self.name, self.value)]
+
+
+class Histogram(Metric):
+    """
+    Распределение значений по корзинам (в секундах)
+    """
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: tuple[float, ...] = (
+            0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+        )
+    ) -> None:
+        super().__init__(name, description)
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+
+    def samples(self) -> list[tuple[str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{bound}"}}', cumulative))
+        samples.append((f'{self.name}_bucket{{le="+Inf"}}', self.count))
+        samples.append((f"{self.name}_count", self.count))
+        samples.append((f"{self.name}_sum", self.sum))
+        return samples
+
+
+@metrics_blueprint.route("/metrics")
+def render_metrics() -> Response:
+    """
+    Метрики воркера в текстовом формате Prometheus. Доступны только
+    с токеном METRICS_TOKEN, эндпоинт открыт через ingress
+    """
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not METRICS_TOKEN or not hmac.compare_digest(
+        token.encode(), METRICS_TOKEN.encode()
+    ):
+        raise HttpError(401, "Invalid metrics token")
+
+    body = "\n".join(metric.render() for metric in _registry.values())
+    return Response(body + "\n", mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,45 @@
+"""Add outbox table
+
+Revision ID: 3c7d2f1a9b4e
+Revises: 9a004a8bdffb
+Create Date: 2026-10-18 20:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7d2f1a9b4e'
+down_revision: Union[str, Sequence[str], None] = '9a004a8bdffb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('outbox',
+    sa.Column('topic', sa.String(length=255), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('target_service', sa.String(length=50), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_outbox_unsent', 'outbox', ['id'],
+        unique=False, postgresql_where=sa.text('sent_at IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_outbox_unsent', table_name='outbox',
+        postgresql_where=sa.text('sent_at IS NULL')
+    )
+    op.drop_table('outbox')
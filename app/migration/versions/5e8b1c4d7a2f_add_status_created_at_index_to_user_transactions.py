@@ -0,0 +1,32 @@
+"""Add (status, created_at) index to user_transactions
+
+Revision ID: 5e8b1c4d7a2f
+Revises: 3c7d2f1a9b4e
+Create Date: 2026-10-18 22:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b1c4d7a2f'
+down_revision: Union[str, Sequence[str], None] = '3c7d2f1a9b4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_user_transactions_status_created_at', 'user_transactions',
+        ['status', 'created_at'], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_user_transactions_status_created_at', table_name='user_transactions'
+    )
@@ -0,0 +1,52 @@
+"""Add publish attempts and dead letter mark to outbox
+
+Revision ID: 7a4d9e2c6b13
+Revises: 5e8b1c4d7a2f
+Create Date: 2026-10-19 10:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7a4d9e2c6b13'
+down_revision: Union[str, Sequence[str], None] = '5e8b1c4d7a2f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('outbox', sa.Column(
+        'attempts', sa.Integer(), server_default='0', nullable=False
+    ))
+    op.add_column('outbox', sa.Column(
+        'last_error', sa.String(length=255), nullable=True
+    ))
+    op.add_column('outbox', sa.Column('failed_at', sa.DateTime(), nullable=True))
+    op.drop_index(
+        'ix_outbox_unsent', table_name='outbox',
+        postgresql_where=sa.text('sent_at IS NULL')
+    )
+    op.create_index(
+        'ix_outbox_unsent', 'outbox', ['id'], unique=False,
+        postgresql_where=sa.text('sent_at IS NULL AND failed_at IS NULL')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(
+        'ix_outbox_unsent', table_name='outbox',
+        postgresql_where=sa.text('sent_at IS NULL AND failed_at IS NULL')
+    )
+    op.create_index(
+        'ix_outbox_unsent', 'outbox', ['id'],
+        unique=False, postgresql_where=sa.text('sent_at IS NULL')
+    )
+    op.drop_column('outbox', 'failed_at')
+    op.drop_column('outbox', 'last_error')
+    op.drop_column('outbox', 'attempts')
@@ -0,0 +1,45 @@
+"""Add EXPIRED transaction status
+
+Revision ID: 9c2e5b7d1f40
+Revises: 7a4d9e2c6b13
+Create Date: 2026-10-19 11:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9c2e5b7d1f40'
+down_revision: Union[str, Sequence[str], None] = '7a4d9e2c6b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ADD VALUE нельзя выполнять в транзакции на PostgreSQL до 12
+    with op.get_context().autocommit_block():
+        op.execute(
+            "ALTER TYPE transactionstatus ADD VALUE IF NOT EXISTS 'EXPIRED'"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Без EXPIRED истекшее списание ближе всего к прежнему COMPLETED
+    op.execute(
+        "UPDATE user_transactions SET status = 'COMPLETED' "
+        "WHERE status = 'EXPIRED'"
+    )
+    op.execute("ALTER TYPE transactionstatus RENAME TO transactionstatus_old")
+    op.execute(
+        "CREATE TYPE transactionstatus AS ENUM "
+        "('PENDING', 'RESERVED', 'DECLINED', 'COMPLETED', 'FAILED')"
+    )
+    op.execute(
+        "ALTER TABLE user_transactions ALTER COLUMN status "
+        "TYPE transactionstatus USING status::text::transactionstatus"
+    )
+    op.execute("DROP TYPE transactionstatus_old")
@@ -0,0 +1,54 @@
+"""
+Разбор отложенных событий outbox.
+
+События, не доставленные за OUTBOX_MAX_ATTEMPTS попыток, помечаются
+failed_at и удаляются через OUTBOX_FAILED_RETENTION. Скрипт показывает
+их и возвращает в очередь релея после устранения причины ошибки:
+    python outbox_requeue.py --list
+    python outbox_requeue.py --id 42 --id 43
+    python outbox_requeue.py --all
+"""
+import argparse
+
+from sqlalchemy import select
+
+from database.database import session
+from database.models import OutboxEvent
+from kafka.outbox import requeue_failed_events
+
+
+def list_failed_events() -> None:
+    with session() as session_db:
+        events = session_db.execute(
+            select(OutboxEvent)
+            .where(OutboxEvent.failed_at.is_not(None))
+            .order_by(OutboxEvent.id)
+        ).scalars().all()
+
+        for event in events:
+            print(
+                f"{event.id}\t{event.topic}\t{event.failed_at:%Y-%m-%d %H:%M:%S}"
+                f"\t{event.attempts}\t{event.last_error}"
+            )
+
+    print(f"Отложенных событий: {len(events)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--list", action="store_true")
+    group.add_argument("--id", type=int, action="append", dest="event_ids")
+    group.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    if args.list:
+        list_failed_events()
+        return
+
+    requeued = requeue_failed_events(args.event_ids)
+    print(f"Возвращено в очередь событий: {requeued}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import math
+import time
+import uuid
+
+from flask import Request, jsonify, request
+from redis.exceptions import RedisError
+
+from config import logger, RATE_LIMITS, RATE_LIMIT_PROXY_HOPS
+from extensions import rate_limit_redis
+from metrics import Counter
+
+
+rate_limit_rejected = Counter(
+    "rate_limit_rejected_total",
+    "Запросы, отклоненные ограничителем частоты"
+)
+
+# Скользящее окно по журналу запросов в ZSET. Все ключи запроса
+# проверяются атомарно: попытка засчитывается только если не превышен
+# ни один лимит, иначе возвращается время до освобождения места (в мс)
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local member = ARGV[2]
+local retry_after = 0
+
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[1 + i * 2])
+    local window = tonumber(ARGV[2 + i * 2])
+    redis.call("ZREMRANGEBYSCORE", key, "-inf", now - window)
+    if redis.call("ZCARD", key) >= limit then
+        local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+        local wait = tonumber(oldest[2]) + window - now
+        if wait > retry_after then
+            retry_after = wait
+        end
+    end
+end
+
+if retry_after > 0 then
+    return retry_after
+end
+
+for i, key in ipairs(KEYS) do
+    local window = tonumber(ARGV[2 + i * 2])
+    redis.call("ZADD", key, now, member)
+    redis.call("PEXPIRE", key, window)
+end
+
+return 0
+"""
+
+
+class RateLimiter:
+    """
+    Ограничитель частоты запросов со скользящим окном в Redis.
+    Лимиты общие для всех подов, считаются по IP клиента и по имени
+    пользователя из тела запроса
+    """
+
+    def __init__(
+        self,
+        redis_instance,
+        limits: dict[str, dict[str, tuple[int, int]]],
+        proxy_hops: int = 0
+    ) -> None:
+        self.redis = redis_instance
+        self.limits = limits
+        self.proxy_hops = proxy_hops
+        self.script = redis_instance.register_script(SLIDING_WINDOW_SCRIPT)
+
+    def client_ip(self, flask_request: Request) -> str:
+        """
+        IP клиента с учетом доверенных прокси перед приложением
+        """
+        forwarded = flask_request.headers.get("X-Forwarded-For")
+        if self.proxy_hops and forwarded:
+            route = [ip.strip() for ip in forwarded.split(",")]
+            return route[max(len(route) - self.proxy_hops, 0)]
+
+        return flask_request.remote_addr or "unknown"
+
+    def _subjects(
+        self,
+        flask_request: Request,
+        endpoint_limits: dict[str, tuple[int, int]]
+    ) -> list[tuple[str, tuple[int, int]]]:
+        subjects = []
+        for subject, limit in endpoint_limits.items():
+            if subject == "ip":
+                value = self.client_ip(flask_request)
+            elif subject == "username":
+                data = flask_request.get_json(silent=True)
+                value = data.get("username") if isinstance(data, dict) else None
+                if not isinstance(value, str) or not value:
+                    continue
+                value = value.strip().lower()
+            else:
+                continue
+
+            key = f"rate_limit:{flask_request.endpoint}:{subject}:{value}"
+            subjects.append((key, limit))
+
+        return subjects
+
+    def hit(self, flask_request: Request) -> int:
+        """
+        Учет попытки запроса
+
+        :param flask_request: текущий запрос
+        :return: 0, если запрос разрешен, иначе через сколько секунд повторить
+        """
+        endpoint_limits = self.limits.get(flask_request.endpoint)
+        if not endpoint_limits:
+            return 0
+
+        subjects = self._subjects(flask_request, endpoint_limits)
+        if not subjects:
+            return 0
+
+        args = [int(time.time() * 1000), uuid.uuid4().hex]
+        for _, (limit, window) in subjects:
+            args.extend((limit, window * 1000))
+
+        try:
+            retry_after_ms = self.script(
+                keys=[key for key, _ in subjects], args=args
+            )
+        except RedisError as e:
+            # Недоступность Redis не должна блокировать вход
+            logger.error(f"[Лимиты] Ошибка Redis, запрос пропущен: {e}")
+            return 0
+
+        return math.ceil(int(retry_after_ms) / 1000)
+
+
+rate_limiter = RateLimiter(
+    rate_limit_redis,
+    limits=RATE_LIMITS,
+    proxy_hops=RATE_LIMIT_PROXY_HOPS
+)
+
+
+def limit_request_rate():
+    """
+    Отклонение запросов сверх лимита до открытия сессии БД и хэширования пароля
+    """
+    retry_after = rate_limiter.hit(request)
+    if not retry_after:
+        return None
+
+    rate_limit_rejected.inc()
+    logger.warning(
+        f"[Лимиты] Превышен лимит запросов к {request.endpoint} "
+        f"с {rate_limiter.client_ip(request)}"
+    )
+    response = jsonify({"error": "Too many requests"})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(retry_after)
+    return response
@@ -0,0 +1,14 @@
+"""
+Точка входа приложения: python server.py
+
+Процессы пула хэширования паролей (forkserver) при старте импортируют
+главный модуль запущенного скрипта. Приложение поэтому импортируется
+только под __main__, и процессы пула не создают Flask приложение,
+продюсер Kafka и фоновые потоки
+"""
+
+
+if __name__ == "__main__":
+    from main import run
+
+    run()
@@ -1,9 +1,8 @@
-import uuid
 from blinker import Namespace
 from errors import HttpError
-from extensions import mail, confirm_code_redis
-from flask_mail import Message
-from smtplib import SMTPRecipientsRefused
+from authorization.confirmation import make_confirmation_token
+from mail_queue import enqueue_mail
+from redis.exceptions import RedisError
 from config import logger
 
 
@@ -13,17 +12,14 @@ def user_registered_handler(sender, **kwargs):
     """
     Обработчик сигнала регистрации пользователя
     """
-    confirm_code = str(uuid.uuid4())
+    user_id = kwargs.get("user_id")
     username = kwargs.get("username")
     email = kwargs.get("email")
 
-    confirm_code_redis.set(confirm_code, username)
+    # Код подписан и содержит срок действия, в Redis ничего не сохраняется
+    confirm_code = make_confirmation_token(user_id)
 
-    msg = Message(
-        "Подтверждение почты при регистрации",
-        recipients=[email]
-    )
-    msg.body = (
+    body = (
         f"Здравствуйте, {username}!\n\n"
         "Спасибо за регистрацию.\n"
         "Чтобы активировать вашу учетную запись, "
@@ -34,12 +30,13 @@ def user_registered_handler(sender, **kwargs):
         "Команда игры Морской бой"
     )
     try:
-        mail.send(msg)
-
-    except SMTPRecipientsRefused as e:
-        raise HttpError(400, "Некорректный email для подтверждения")
+        # Письмо отправляют воркеры очереди, регистрация не ждет SMTP
+        enqueue_mail(
+            "Подтверждение почты при регистрации",
+            recipients=[email],
+            body=body
+        )
 
-    except Exception as e:
-        logger.error(f"Ошибка отправки письма: {e}")
+    except RedisError as e:
+        logger.error(f"Ошибка постановки письма в очередь: {e}")
         raise HttpError(500, "Ошибка отправки письма")
-    
\ No newline at end of file
@@ -2,8 +2,8 @@ from sqlalchemy.orm import Session, joinedload
 from database.models import UserBase
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
-from werkzeug.security import generate_password_hash
-from kafka.producer import send_message_to_kafka
+from hashing import password_hasher
+from kafka.outbox import enqueue_event
 
 
 def get_user_by_id(
@@ -99,21 +99,24 @@ def update_user(
 
         original_username = user.username
         if "password" in kwargs:
-            kwargs["h_password"] = generate_password_hash(kwargs["password"])
+            kwargs["h_password"] = password_hasher.generate(
+                kwargs["password"]
+            )
 
         for key, value in kwargs.items():
             setattr(user, key, value)
 
-        session_db.commit()
-        session_db.refresh(user)
-
         if "username" in kwargs and kwargs["username"] != original_username:
-            send_message_to_kafka(
+            enqueue_event(
+                session_db,
                 topic="prod.auth.fact.username-change.1",
                 payload={"user_id": user.id, "username": user.username},
                 target_service="scoreboard"
             )
 
+        session_db.commit()
+        session_db.refresh(user)
+
         return user
 
     except SQLAlchemyError as e:
@@ -135,13 +138,13 @@ def delete_user(session_db: Session, user_id: int) -> bool:
             return False
 
         session_db.delete(user)
-        session_db.commit()
-
-        send_message_to_kafka(
+        enqueue_event(
+            session_db,
             topic="auth.user.delete.response.guild",
             payload={"user_id": user.id},
             target_service="guilds"
         )
+        session_db.commit()
 
         return True
 
@@ -1,10 +1,11 @@
+import time
 from typing import Dict, List
 
 from errors import HttpError
 
-from extensions import jwt_redis_blocklist
+from authorization.revocation import token_blocklist
 
-from config import logger, JWT_ACCESS_BLOCKLIST
+from config import logger
 
 from decorators import with_session
 
@@ -264,8 +265,10 @@ class LogoutUserResource(BaseUserView):
         :return: Dict[str, str] | HttpError
         """
         try:
-            jti = get_jwt()["jti"]
-            jwt_redis_blocklist.set(jti, "", ex=JWT_ACCESS_BLOCKLIST)
+            claims = get_jwt()
+            # Запись об отзыве нужна только пока токен не истек сам
+            expires = max(int(claims["exp"] - time.time()), 1)
+            token_blocklist.revoke(claims["jti"], expires)
 
             response = make_response({"message": "Пользователь вышел"}, 200)
             unset_access_cookies(response)
@@ -279,6 +282,34 @@ class LogoutUserResource(BaseUserView):
             self.handle_error(HttpError, "Internal server error", 500)
 
 
+class LogoutAllUserResource(BaseUserView):
+
+    @jwt_required()
+    def post(self) -> Dict[str, str] | HttpError:
+        """
+        Выход пользователя на всех устройствах
+
+        :return: Dict[str, str] | HttpError
+        """
+        try:
+            token_blocklist.revoke_user(self.user_id)
+
+            response = make_response(
+                {"message": "Пользователь вышел на всех устройствах"}, 200
+            )
+            unset_access_cookies(response)
+            unset_refresh_cookies(response)
+
+            logger.info(f"All tokens revoked for user {self.user_id}")
+            return response
+
+        except Exception as e:
+            logger.error(
+                f"Ошибка при выходе пользователя на всех устройствах: {e}"
+            )
+            self.handle_error(HttpError, "Internal server error", 500)
+
+
 user_blueprint.add_url_rule(
     "/<int:user_id>",
     view_func=UserView.as_view("user")
@@ -291,3 +322,7 @@ user_blueprint.add_url_rule(
     "/logout/",
     view_func=LogoutUserResource.as_view("logout")
 )
+user_blueprint.add_url_rule(
+    "/logout/all/",
+    view_func=LogoutAllUserResource.as_view("logout_all")
+)
@@ -0,0 +1,141 @@
+"""
+Пропускная способность резервирования баланса при конкуренции за одного
+пользователя: прежняя схема "прочитать баланс, изменить в Python, записать"
+против атомарного условного UPDATE с записью транзакции одним запросом
+(kafka.services.reserve_balance).
+
+Потоки резервируют по 1 gold у небольшого числа пользователей. Кроме
+операций в секунду считаются потерянные обновления: разница между
+ожидаемым остатком по числу RESERVED транзакций и фактическим.
+
+Нужна база данных из настроек приложения (POSTGRES_*). Для замера
+создаются пользователи contention_*.
+
+Запуск из корня репозитория:
+    python benchmarks/balance_reserve_contention.py --threads 16 --users 2
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from threading import Thread
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from database.database import session  # noqa: E402
+from database.models import (  # noqa: E402
+    UserBase, UserCurrency, UserTransaction, CurrencyType, TransactionStatus
+)
+from kafka.services import reserve_balance  # noqa: E402
+
+
+def seed_users(count: int, balance: int) -> list[int]:
+    with session() as session_db:
+        users = []
+        for number in range(count):
+            username = f"contention_{number}"
+            user = session_db.query(UserBase).filter_by(username=username).first()
+            if user is None:
+                user = UserBase(
+                    username=username,
+                    email=f"{username}@example.com",
+                    is_active=True
+                )
+                session_db.add(user)
+                session_db.flush()
+                session_db.add(UserCurrency(user_id=user.id))
+                session_db.flush()
+            users.append(user.id)
+
+        session_db.query(UserCurrency).filter(
+            UserCurrency.user_id.in_(users)
+        ).update({UserCurrency.gold: balance}, synchronize_session=False)
+        session_db.query(UserTransaction).filter(
+            UserTransaction.user_id.in_(users)
+        ).delete(synchronize_session=False)
+        session_db.commit()
+        return users
+
+
+def reserve_read_modify_write(session_db, transaction_id: str, user_id: int) -> None:
+    # Прежняя схема обработчика: баланс читается и меняется в Python
+    currency = session_db.query(UserCurrency).filter_by(user_id=user_id).first()
+    status = TransactionStatus.DECLINED
+    if currency.gold >= 1:
+        currency.gold -= 1
+        status = TransactionStatus.RESERVED
+
+    session_db.add(UserTransaction(
+        transaction_id=transaction_id, user_id=user_id,
+        currency_type=CurrencyType.GOLD, amount=1, status=status
+    ))
+
+
+def reserve_atomic(session_db, transaction_id: str, user_id: int) -> None:
+    reserve_balance(session_db, transaction_id, user_id, CurrencyType.GOLD, 1)
+
+
+MODES = {
+    "read-modify-write": reserve_read_modify_write,
+    "atomic": reserve_atomic
+}
+
+
+def run(mode: str, users: list[int], threads: int, operations: int) -> float:
+    reserve = MODES[mode]
+
+    def worker(number: int) -> None:
+        for operation in range(operations):
+            with session() as session_db:
+                reserve(
+                    session_db,
+                    f"bench:{uuid.uuid4()}",
+                    users[(number + operation) % len(users)]
+                )
+                session_db.commit()
+
+    workers = [Thread(target=worker, args=(number,)) for number in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started
+
+
+def lost_updates(users: list[int], balance: int) -> int:
+    with session() as session_db:
+        reserved = session_db.query(UserTransaction).filter(
+            UserTransaction.user_id.in_(users),
+            UserTransaction.status == TransactionStatus.RESERVED
+        ).count()
+        actual = sum(
+            currency.gold for currency in session_db.query(UserCurrency).filter(
+                UserCurrency.user_id.in_(users)
+            )
+        )
+    return actual - (balance * len(users) - reserved)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--users", type=int, default=2)
+    parser.add_argument("--operations", type=int, default=200, help="резервирований на поток")
+    args = parser.parse_args()
+
+    balance = args.threads * args.operations
+    print(f"{'схема':<20}{'операций/с':>12}{'потеряно обновлений':>22}")
+    for mode in MODES:
+        users = seed_users(args.users, balance)
+        elapsed = run(mode, users, args.threads, args.operations)
+        total = args.threads * args.operations
+        print(
+            f"{mode:<20}{total / elapsed:>12.0f}"
+            f"{lost_updates(users, balance):>22}"
+        )
+
+
+if __name__ == "__main__":
+    main()
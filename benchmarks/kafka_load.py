@@ -0,0 +1,226 @@
+"""
+Нагрузочный замер консьюмера Kafka и обработчиков на брокере в памяти.
+
+Генератор отправляет запросы резервирования баланса от shop и объявления
+войны от guilds, часть успешных операций затем компенсируется, как в
+реальных сагах. Считаются пропускная способность консьюмера и задержка
+от отправки запроса до ответа обработчика.
+
+Нужна база данных из настроек приложения (POSTGRES_*): обработчики
+работают с ней как обычно. Для замера создаются пользователи loadtest_*.
+
+Запуск из корня репозитория:
+    python benchmarks/kafka_load.py --messages 5000 --users 200
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from threading import Thread
+
+os.environ.setdefault("KAFKA_BACKEND", "memory")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from database.database import session  # noqa: E402
+from database.models import UserBase, UserCurrency  # noqa: E402
+from kafka.consumer import start_consumer_loop  # noqa: E402
+from kafka.memory_broker import (  # noqa: E402
+    broker, MemoryConsumer, MemoryProducer
+)
+from kafka.serializers import serializer  # noqa: E402
+
+
+RESERVE = "shop.balance.reserve.request.auth"
+COMPENSATE = "shop.balance.compensate.request.auth"
+WAR_DECLARE = "initiator_guild_wants_declare_war"
+WAR_COMPENSATE = "guild_war_canceled_declined_expired"
+
+RESPONSES = {
+    "auth.balance.reserve.response.shop": RESERVE,
+    "auth.balance.compensate.response.shop": COMPENSATE,
+    "auth.guild_war.declare.response.guild": WAR_DECLARE
+}
+# Топик событий для таблицы лидеров, в него пишут обработчики
+CURRENCY_CHANGE = "prod.auth.fact.currency-change.1"
+CONSUMER_GROUP = "auth-service-group"
+
+
+def seed_users(count: int, balance: int) -> list[int]:
+    """
+    Пользователи для замера с достаточным балансом
+    """
+    with session() as session_db:
+        users = []
+        for number in range(count):
+            username = f"loadtest_{number}"
+            user = session_db.query(UserBase).filter_by(username=username).first()
+            if user is None:
+                user = UserBase(
+                    username=username,
+                    email=f"{username}@example.com",
+                    is_active=True
+                )
+                session_db.add(user)
+                session_db.flush()
+                session_db.add(UserCurrency(user_id=user.id))
+                session_db.flush()
+            users.append(user.id)
+
+        session_db.query(UserCurrency).filter(
+            UserCurrency.user_id.in_(users)
+        ).update(
+            {UserCurrency.gold: balance, UserCurrency.guild_rage: balance},
+            synchronize_session=False
+        )
+        session_db.commit()
+        return users
+
+
+def delete_users(user_ids: list[int]) -> None:
+    with session() as session_db:
+        for user in session_db.query(UserBase).filter(UserBase.id.in_(user_ids)):
+            session_db.delete(user)
+        session_db.commit()
+
+
+class LoadGenerator:
+    def __init__(self, users: list[int], compensate_ratio: float) -> None:
+        self.users = users
+        self.compensate_ratio = compensate_ratio
+        self.producer = MemoryProducer({})
+        self.sent: dict[tuple[str, str], float] = {}
+        self.latencies: dict[str, list[float]] = {topic: [] for topic in RESPONSES.values()}
+        self.requests: dict[str, dict] = {}
+        self.produced = 0
+
+    def send(self, topic: str, payload: dict, request_id: str) -> None:
+        self.sent[(topic, request_id)] = time.perf_counter()
+        self.producer.produce(topic, serializer.dumps(payload))
+        self.produced += 1
+
+    def send_reserve(self) -> None:
+        transaction_id = str(uuid.uuid4())
+        payload = {
+            "transaction_id": transaction_id,
+            "user_id": random.choice(self.users),
+            "cost": random.randint(1, 50),
+            "currency_type": "GOLD"
+        }
+        self.requests[transaction_id] = payload
+        self.send(RESERVE, payload, transaction_id)
+
+    def send_war_declare(self) -> None:
+        correlation_id = str(uuid.uuid4())
+        payload = {
+            "initiator_guild_id": random.randint(1, 1000),
+            "initiator_owner_id": random.choice(self.users),
+            "correlation_id": correlation_id
+        }
+        self.requests[correlation_id] = payload
+        self.send(WAR_DECLARE, payload, correlation_id)
+
+    def on_response(self, topic: str, payload: dict) -> None:
+        """
+        Учет ответа обработчика и, для части успешных операций, компенсация
+        """
+        request_topic = RESPONSES[topic]
+        request_id = payload.get("transaction_id") or payload.get("correlation_id")
+        sent_at = self.sent.pop((request_topic, request_id), None)
+        if sent_at is not None:
+            self.latencies[request_topic].append(time.perf_counter() - sent_at)
+
+        if not payload.get("success") or random.random() >= self.compensate_ratio:
+            return
+
+        if request_topic == RESERVE:
+            self.send(COMPENSATE, self.requests[request_id], request_id)
+        elif request_topic == WAR_DECLARE:
+            request = self.requests[request_id]
+            self.producer.produce(WAR_COMPENSATE, serializer.dumps({
+                "initiator_owner_id": request["initiator_owner_id"],
+                "correlation_id": request_id,
+                "status": "declined"
+            }))
+            self.produced += 1
+
+
+def collect(generator: LoadGenerator, consumer: MemoryConsumer) -> None:
+    while True:
+        for message in consumer.consume(100, 0.1):
+            generator.on_response(message.topic(), serializer.loads(message.value()))
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=0, help="сообщений в секунду, 0 - без ограничения")
+    parser.add_argument("--war-share", type=float, default=0.2)
+    parser.add_argument("--compensate-ratio", type=float, default=0.3)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--cleanup", action="store_true")
+    args = parser.parse_args()
+
+    users = seed_users(args.users, balance=args.messages * 50)
+    generator = LoadGenerator(users, args.compensate_ratio)
+
+    for topic in [*RESPONSES, *RESPONSES.values(), WAR_COMPENSATE, CURRENCY_CHANGE]:
+        broker.create_topic(topic)
+
+    responses = MemoryConsumer({"group.id": "loadtest", "auto.offset.reset": "earliest"})
+    responses.subscribe(list(RESPONSES))
+    Thread(target=collect, args=(generator, responses), daemon=True).start()
+    Thread(target=start_consumer_loop, daemon=True).start()
+
+    started = time.perf_counter()
+    for number in range(args.messages):
+        if random.random() < args.war_share:
+            generator.send_war_declare()
+        else:
+            generator.send_reserve()
+
+        if args.rate:
+            delay = started + (number + 1) / args.rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    # Ждем, пока консьюмер разберет все запросы, включая компенсации
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        if not generator.sent and broker.lag(CONSUMER_GROUP) == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    print(
+        f"Обработано сообщений: {generator.produced} за {elapsed:.2f} с, "
+        f"{generator.produced / elapsed:.0f} сообщений/с"
+    )
+    if generator.sent:
+        print(f"Без ответа осталось запросов: {len(generator.sent)}")
+
+    print(f"{'запрос':<40}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}")
+    for topic, values in generator.latencies.items():
+        if not values:
+            continue
+        print(
+            f"{topic:<40}{len(values):>8}"
+            f"{statistics.median(values) * 1000:>10.1f}"
+            f"{percentile(values, 0.95) * 1000:>10.1f}"
+            f"{percentile(values, 0.99) * 1000:>10.1f}"
+        )
+
+    if args.cleanup:
+        delete_users(users)
+
+
+if __name__ == "__main__":
+    main()
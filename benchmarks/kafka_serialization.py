@@ -0,0 +1,126 @@
+"""
+Сравнение сериализаторов сообщений Kafka на реальных payload сервиса:
+время кодирования и декодирования, размер сообщения и пачки после сжатия.
+
+Сжатие пачки считается кодеками, доступными в окружении: gzip всегда,
+lz4 и zstd - если установлены пакеты lz4 и zstandard.
+
+Запуск из корня репозитория:
+    python benchmarks/kafka_serialization.py --iterations 20000 --batch 100
+"""
+import argparse
+import gzip
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from kafka.serializers import SERIALIZERS, orjson  # noqa: E402
+
+
+PAYLOADS = {
+    "balance.reserve.request": {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": 123456,
+        "cost": 250,
+        "currency_type": "GOLD"
+    },
+    "balance.reserve.response": {
+        "transaction_id": str(uuid.uuid4()),
+        "user_id": 123456,
+        "success": True,
+        "error_message": "null"
+    },
+    "guild_war.declare.response": {
+        "initiator_guild_id": 42,
+        "initiator_owner_id": 123456,
+        "correlation_id": str(uuid.uuid4()),
+        "success": True
+    },
+    "currency-change": {"user_id": 123456, "gold": 1750},
+    "new-user": {
+        "user_id": 123456,
+        "username": "battleship_captain",
+        "email": "captain@example.com",
+        "role": "user",
+        "gold": 0
+    }
+}
+
+
+def vary(payload: dict, number: int) -> dict:
+    """
+    Копия payload с уникальными идентификаторами, как в реальной пачке
+    """
+    varied = dict(payload)
+    for key, value in payload.items():
+        if key.endswith("_id"):
+            varied[key] = (
+                value + number if isinstance(value, int) else str(uuid.uuid4())
+            )
+    return varied
+
+
+def compressors() -> dict:
+    codecs = {"gzip": lambda data: gzip.compress(data, compresslevel=6)}
+    try:
+        import lz4.frame
+        codecs["lz4"] = lz4.frame.compress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+        codecs["zstd"] = zstandard.ZstdCompressor().compress
+    except ImportError:
+        pass
+
+    return codecs
+
+
+def measure(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=100)
+    args = parser.parse_args()
+
+    serializers = [
+        backend for name, backend in SERIALIZERS.items()
+        if name != "orjson" or orjson is not None
+    ]
+    codecs = compressors()
+
+    print(
+        f"{'payload':<28}{'бэкенд':<8}{'кодир., мкс':>12}"
+        f"{'декод., мкс':>12}{'байт':>6}"
+        + "".join(f"{f'пачка {codec}':>14}" for codec in ["raw", *codecs])
+    )
+    for name, payload in PAYLOADS.items():
+        for backend in serializers:
+            value = backend.dumps(payload)
+            encode_us = measure(lambda: backend.dumps(payload), args.iterations)
+            decode_us = measure(lambda: backend.loads(value), args.iterations)
+
+            # librdkafka сжимает пачку сообщений целиком
+            batch = b"".join(
+                backend.dumps(vary(payload, number))
+                for number in range(args.batch)
+            )
+            sizes = [len(batch)] + [len(c(batch)) for c in codecs.values()]
+            print(
+                f"{name:<28}{backend.name:<8}{encode_us:>12.2f}"
+                f"{decode_us:>12.2f}{len(value):>6}"
+                + "".join(f"{size:>14}" for size in sizes)
+            )
+
+
+if __name__ == "__main__":
+    main()
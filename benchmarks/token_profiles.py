@@ -0,0 +1,102 @@
+"""
+Сравнение профилей JWT: время подписи и проверки, размер токена и
+заголовков запроса.
+
+Запуск из корня репозитория:
+    python benchmarks/token_profiles.py --iterations 2000
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "app"))
+
+from authorization.tokens import TOKEN_PROFILES  # noqa: E402
+
+
+def generate_key(algorithm: str):
+    if algorithm == "RS256":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+
+    raise ValueError(f"Неизвестный алгоритм: {algorithm}")
+
+
+def build_payload(names: dict) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "fresh": False,
+        "iat": now,
+        "jti": str(uuid.uuid4()),
+        "type": "access",
+        "sub": "123456",
+        "nbf": now,
+        "csrf": str(uuid.uuid4()),
+        "exp": now + timedelta(days=1),
+        names["username"]: "battleship_captain",
+        names["role"]: "user",
+        names["is_active"]: True
+    }
+
+
+def measure(func, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - started) / iterations * 1_000_000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    profiles = dict(TOKEN_PROFILES)
+    # Для сравнения также compact профиль с EdDSA
+    profiles["compact-eddsa"] = {
+        "algorithm": "EdDSA", "claims": TOKEN_PROFILES["compact"]["claims"]
+    }
+
+    print(
+        f"{'профиль':<15}{'алг.':<7}{'подпись, мкс':>14}"
+        f"{'проверка, мкс':>15}{'токен, байт':>13}{'заголовки, байт':>17}"
+    )
+    for name, profile in profiles.items():
+        algorithm = profile["algorithm"]
+        private_key = generate_key(algorithm)
+        public_key = private_key.public_key()
+        payload = build_payload(profile["claims"])
+        headers = {"kid": "0123456789abcdef"}
+
+        token = jwt.encode(payload, private_key, algorithm, headers=headers)
+        sign_us = measure(
+            lambda: jwt.encode(payload, private_key, algorithm, headers=headers),
+            args.iterations
+        )
+        verify_us = measure(
+            lambda: jwt.decode(token, public_key, algorithms=[algorithm]),
+            args.iterations
+        )
+
+        # Токен уходит и в заголовке Authorization, и в cookie
+        request_headers = (
+            f"Authorization: Bearer {token}\r\n"
+            f"Cookie: access_token_cookie=Bearer {token}\r\n"
+        )
+        print(
+            f"{name:<15}{algorithm:<7}{sign_us:>14.1f}{verify_us:>15.1f}"
+            f"{len(token):>13}{len(request_headers):>17}"
+        )
+
+
+if __name__ == "__main__":
+    main()